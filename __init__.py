@@ -39,11 +39,15 @@ if "bpy" in locals():
     if 'export_bf3d' in locals():
         imp.reload(export_bf3d)
         imp.reload(struct_bf3d)
+        imp.reload(tangent_bf3d)
+        imp.reload(dds_bf3d)
+        imp.reload(layout_bf3d)
+        imp.reload(live_bf3d)
 
 import time
 import datetime
 import bpy
-from bpy.props import StringProperty, BoolProperty, EnumProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, FloatProperty
 from bpy_extras.io_utils import ImportHelper, ExportHelper
 		
 class ExportBF3D(bpy.types.Operator, ExportHelper):
@@ -62,6 +66,90 @@ class ExportBF3D(bpy.types.Operator, ExportHelper):
 			('A', "Animation", "this will export the animation without any geometry data or skeletons"), 
 			),
 			default='M',)
+
+    STATIC_BATCHING = BoolProperty(
+            name="Static Batching",
+            description="merge non-skinned meshes with the same material and parent pivot into one mesh",
+            default=False,)
+
+    BATCH_MAX_VERTS = IntProperty(
+            name="Max Batch Vertices",
+            description="maximum number of vertices of a merged mesh",
+            min=3, max=1000000,
+            default=65535,)
+
+    SKIN_MAX_INFLUENCES = IntProperty(
+            name="Max Bone Influences",
+            description="number of strongest bone influences kept per vertex",
+            min=1, max=8,
+            default=2,)
+
+    SKIN_MAX_BONES = IntProperty(
+            name="Max Bones per Mesh",
+            description="split skinned meshes so every part uses at most this many bones (0 = no limit)",
+            min=0, max=1024,
+            default=0,)
+
+    COMPRESSION = EnumProperty(
+            name="Compression",
+            items=(('NONE', "None", "write all chunks uncompressed"),
+			('ZLIB', "zlib", "compress large mesh and animation chunks with zlib"),
+			('LZMA', "LZMA", "compress large mesh and animation chunks with lzma (smaller, slower)"),
+			),
+			default='NONE',)
+
+    COMPRESSION_LEVEL = IntProperty(
+            name="Compression Level",
+            description="level of the compression codec",
+            min=0, max=9,
+            default=6,)
+
+    COMPRESSION_THRESHOLD = IntProperty(
+            name="Compression Threshold",
+            description="chunks smaller than this many bytes are written uncompressed",
+            min=0,
+            default=4096,)
+
+    ALL_ACTIONS = BoolProperty(
+            name="All Actions",
+            description="export every action of the armature into its own animation file",
+            default=False,)
+
+    ACTION_FILTER = StringProperty(
+            name="Action Filter",
+            description="only actions whose name matches this pattern are exported (* and ? wildcards)",
+            default="*",)
+
+    MESH_BOUNDS = BoolProperty(
+            name="Mesh Bounds",
+            description="write a bounding box and sphere for every mesh and a bvh over all meshes",
+            default=True,)
+
+    TANGENTS = BoolProperty(
+            name="Tangents",
+            description="write per vertex tangents and bitangent signs for normal mapping",
+            default=True,)
+
+    TEXTURES = BoolProperty(
+            name="Textures",
+            description="assign material ids and convert the images of the materials to dds next to the model",
+            default=False,)
+
+    TEXTURE_MIPMAPS = BoolProperty(
+            name="Texture Mipmaps",
+            description="generate mipmaps for the converted textures",
+            default=True,)
+
+    MESH_LAYOUT = BoolProperty(
+            name="Mesh Layout",
+            description="sort the triangles spatially into clusters and write the indices as compressed streams",
+            default=False,)
+
+    CLUSTER_SIZE = IntProperty(
+            name="Cluster Size",
+            description="number of triangles per cluster",
+            min=1, max=4096,
+            default=64,)
 		
     def execute(self, context):
         from . import export_bf3d
@@ -74,15 +162,120 @@ class ExportBF3D(bpy.types.Operator, ExportHelper):
         print('Finished exporting in', t, 'seconds')
         return {'FINISHED'}	
 
+class ExportBF3DBackground(ExportBF3D):
+    '''Export to bf3d file format (.bf3d) without blocking the user interface'''
+    bl_idname = 'export_mesh.bf3d_background'
+    bl_label = 'Export BF3D (Background)'
+
+    def execute(self, context):
+        import threading
+        from . import export_bf3d
+        keywords = self.as_keywords(ignore=("filter_glob", "check_existing", "filepath",
+                "COMPRESSION", "COMPRESSION_LEVEL", "COMPRESSION_THRESHOLD"))
+
+        print('Exporting file', self.filepath)
+        self._start = time.time()
+        # the scene data has to be read on the main thread, only the writing runs in the background
+        files = export_bf3d.CollectExport(self.filepath, context, self, **keywords)
+        self._compression = export_bf3d.getChunkCompression(self.COMPRESSION, self.COMPRESSION_LEVEL, self.COMPRESSION_THRESHOLD)
+
+        self._progress = 0.0
+        self._error = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self.write, args=(export_bf3d, files))
+        self._thread.start()
+
+        wm = context.window_manager
+        wm.progress_begin(0, 100)
+        self._timer = wm.event_timer_add(0.1, context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def write(self, export_bf3d, files):
+        def progress(fraction):
+            if self._cancel.is_set():
+                raise export_bf3d.ExportCancelled()
+            self._progress = fraction
+        try:
+            export_bf3d.WriteExportFiles(files, progress, self._compression)
+        except export_bf3d.ExportCancelled:
+            pass
+        except Exception as e:
+            self._error = e
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._cancel.set()
+        if not event.type == 'TIMER':
+            return {'PASS_THROUGH'}
+
+        wm = context.window_manager
+        wm.progress_update(int(self._progress * 100))
+        if self._thread.is_alive():
+            return {'PASS_THROUGH'}
+
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        if self._error is not None:
+            self.report({'ERROR'}, "export failed: " + str(self._error))
+            return {'CANCELLED'}
+        if self._cancel.is_set():
+            self.report({'WARNING'}, "export cancelled")
+            return {'CANCELLED'}
+        if self._compression is not None:
+            self.report({'INFO'}, self._compression.report())
+        print('Finished exporting in', time.time() - self._start, 'seconds')
+        return {'FINISHED'}
+
+class ExportBF3DLiveLink(ExportBF3D):
+    '''Export to bf3d file format (.bf3d) again whenever the scene changes'''
+    bl_idname = 'export_mesh.bf3d_live_link'
+    bl_label = 'Start BF3D Live Link'
+
+    LIVE_DEBOUNCE = FloatProperty(
+            name="Debounce",
+            description="seconds without edits before the files are updated",
+            min=0.0, max=10.0,
+            default=0.2,)
+
+    def execute(self, context):
+        from . import export_bf3d, live_bf3d
+        keywords = self.as_keywords(ignore=("filter_glob", "check_existing", "filepath", "LIVE_DEBOUNCE",
+                "COMPRESSION", "COMPRESSION_LEVEL", "COMPRESSION_THRESHOLD"))
+        compression = export_bf3d.getChunkCompression(self.COMPRESSION, self.COMPRESSION_LEVEL, self.COMPRESSION_THRESHOLD)
+        live_bf3d.startLiveLink(self.filepath, keywords, compression, self.LIVE_DEBOUNCE)
+        self.report({'INFO'}, "live link to " + self.filepath)
+        return {'FINISHED'}
+
+
+class StopBF3DLiveLink(bpy.types.Operator):
+    '''Stop updating the bf3d files of the live link'''
+    bl_idname = 'export_mesh.bf3d_live_link_stop'
+    bl_label = 'Stop BF3D Live Link'
+
+    def execute(self, context):
+        from . import live_bf3d
+        latency = live_bf3d.stopLiveLink()
+        if latency is not None:
+            self.report({'INFO'}, "live link stopped, last update took %.3f seconds" % latency)
+        return {'FINISHED'}
+
 		
 def menu_func_export(self, context):
     self.layout.operator(ExportBF3D.bl_idname, text='ByteForge 3D (.bf3d)')
+    self.layout.operator(ExportBF3DBackground.bl_idname, text='ByteForge 3D (.bf3d) - Background')
+    self.layout.operator(ExportBF3DLiveLink.bl_idname, text='ByteForge 3D (.bf3d) - Live Link')
+    self.layout.operator(StopBF3DLiveLink.bl_idname, text='ByteForge 3D (.bf3d) - Stop Live Link')
 
 def register():
+    from . import live_bf3d
     bpy.utils.register_module(__name__)
     bpy.types.INFO_MT_file_export.append(menu_func_export)
+    live_bf3d.register()
 
 def unregister():
+    from . import live_bf3d
+    live_bf3d.unregister()
     bpy.utils.unregister_module(__name__)
     bpy.types.INFO_MT_file_export.remove(menu_func_export)
 
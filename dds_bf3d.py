@@ -0,0 +1,138 @@
+#DDS textures of the BF3D Format
+#BC1 (DXT1) and BC3 (DXT5) block compression on the cpu, only depends on numpy
+import struct
+import numpy
+
+#blocks encoded at once, limits the size of the temporary arrays
+BATCH = 16384
+
+#######################################################################################
+# Mipmaps
+#######################################################################################
+
+def buildMipmaps(image):
+	#box filtered mipmap chain of a (height, width, 4) uint8 image down to 1x1
+	levels = [image]
+	current = image.astype(numpy.float32)
+	while current.shape[0] > 1 or current.shape[1] > 1:
+		height = max(current.shape[0] // 2, 1)
+		width = max(current.shape[1] // 2, 1)
+		if current.shape[0] > 1:
+			current = (current[0:2 * height:2] + current[1:2 * height:2]) / 2.0
+		if current.shape[1] > 1:
+			current = (current[:, 0:2 * width:2] + current[:, 1:2 * width:2]) / 2.0
+		levels.append(numpy.clip(current + 0.5, 0, 255).astype(numpy.uint8))
+	return levels
+
+#######################################################################################
+# Blocks
+#######################################################################################
+
+def getBlocks(image):
+	#splits the image into 4x4 blocks in row major order, returns a (blockCount, 16, 4) float array
+	height, width = image.shape[0:2]
+	padded = numpy.pad(image, ((0, -height % 4), (0, -width % 4), (0, 0)), mode = 'edge')
+	blocksHigh = padded.shape[0] // 4
+	blocksWide = padded.shape[1] // 4
+	blocks = padded.reshape(blocksHigh, 4, blocksWide, 4, 4).swapaxes(1, 2)
+	return blocks.reshape(-1, 16, 4).astype(numpy.float32)
+
+def packColor565(colors):
+	colors = numpy.clip(colors, 0, 255)
+	r = (colors[:, 0] * 31.0 / 255.0 + 0.5).astype(numpy.uint16)
+	g = (colors[:, 1] * 63.0 / 255.0 + 0.5).astype(numpy.uint16)
+	b = (colors[:, 2] * 31.0 / 255.0 + 0.5).astype(numpy.uint16)
+	return (r << 11) | (g << 5) | b
+
+def unpackColor565(packed):
+	r = (packed >> 11) & 31
+	g = (packed >> 5) & 63
+	b = packed & 31
+	return numpy.stack(((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)), axis = 1).astype(numpy.float32)
+
+def encodeColorBlocks(rgb):
+	#bc1 color blocks in four color mode from (blockCount, 16, 3), returns (blockCount, 8) bytes
+	low = rgb.min(axis = 1)
+	high = rgb.max(axis = 1)
+	inset = (high - low) / 16.0
+	c0 = packColor565(high - inset)
+	c1 = packColor565(low + inset)
+
+	#four color mode needs c0 > c1
+	swap = c0 < c1
+	c0[swap], c1[swap] = c1[swap], c0[swap].copy()
+	p0 = unpackColor565(c0)
+	p1 = unpackColor565(c1)
+	palette = numpy.stack((p0, p1, (2.0 * p0 + p1) / 3.0, (p0 + 2.0 * p1) / 3.0), axis = 1)
+
+	dist = ((rgb[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(axis = 3)
+	indices = dist.argmin(axis = 2).astype(numpy.uint32)
+	indices[c0 == c1] = 0
+	bits = (indices << (2 * numpy.arange(16, dtype = numpy.uint32))).sum(axis = 1, dtype = numpy.uint32)
+
+	out = numpy.empty(len(rgb), dtype = [('c0', '<u2'), ('c1', '<u2'), ('bits', '<u4')])
+	out['c0'] = c0
+	out['c1'] = c1
+	out['bits'] = bits
+	return out.view(numpy.uint8).reshape(-1, 8)
+
+def encodeAlphaBlocks(alpha):
+	#bc3 alpha blocks in eight value mode from (blockCount, 16), returns (blockCount, 8) bytes
+	a0 = numpy.round(alpha.max(axis = 1))
+	a1 = numpy.round(alpha.min(axis = 1))
+	weights = numpy.array([0.0, 7.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0]) / 7.0
+	palette = a0[:, None] * (1.0 - weights) + a1[:, None] * weights
+
+	indices = numpy.abs(alpha[:, :, None] - palette[:, None, :]).argmin(axis = 2).astype(numpy.uint64)
+	indices[a0 == a1] = 0
+	bits = (indices << (3 * numpy.arange(16, dtype = numpy.uint64))).sum(axis = 1, dtype = numpy.uint64)
+
+	out = numpy.empty((len(alpha), 8), dtype = numpy.uint8)
+	out[:, 0] = a0
+	out[:, 1] = a1
+	for byte in range(6):
+		out[:, 2 + byte] = (bits >> numpy.uint64(8 * byte)) & numpy.uint64(255)
+	return out
+
+def encodeBC1(image):
+	blocks = getBlocks(image)
+	out = [encodeColorBlocks(blocks[i:i + BATCH, :, 0:3]) for i in range(0, len(blocks), BATCH)]
+	return numpy.concatenate(out).tobytes()
+
+def encodeBC3(image):
+	blocks = getBlocks(image)
+	out = []
+	for i in range(0, len(blocks), BATCH):
+		batch = blocks[i:i + BATCH]
+		out.append(numpy.concatenate((encodeAlphaBlocks(batch[:, :, 3]), encodeColorBlocks(batch[:, :, 0:3])), axis = 1))
+	return numpy.concatenate(out).tobytes()
+
+#######################################################################################
+# DDS
+#######################################################################################
+
+def getDDSHeader(width, height, mipCount, fourCC, linearSize):
+	flags = 0x1 | 0x2 | 0x4 | 0x1000 | 0x80000 #caps, height, width, pixelformat, linearsize
+	caps = 0x1000 #texture
+	if mipCount > 1:
+		flags |= 0x20000 #mipmapcount
+		caps |= 0x8 | 0x400000 #complex, mipmap
+	return struct.pack('<4s7I44x2I4s5I5I', b'DDS ', 124, flags, height, width, linearSize, 0, mipCount,
+		32, 0x4, fourCC, 0, 0, 0, 0, 0, caps, 0, 0, 0, 0)
+
+def encodeDDS(image, mipmaps = True):
+	#encodes a (height, width, 4) uint8 image (top row first), images with transparency use BC3 otherwise BC1
+	hasAlpha = (image[:, :, 3] < 255).any()
+	encode = encodeBC3 if hasAlpha else encodeBC1
+	levels = buildMipmaps(image) if mipmaps else [image]
+	data = [encode(level) for level in levels]
+	header = getDDSHeader(image.shape[1], image.shape[0], len(levels), b'DXT5' if hasAlpha else b'DXT1', len(data[0]))
+	return header + b''.join(data)
+
+if __name__ == "__main__":
+	import time
+	for size in (256, 1024, 2048):
+		image = numpy.random.RandomState(0).randint(0, 256, (size, size, 4)).astype(numpy.uint8)
+		start = time.time()
+		data = encodeDDS(image)
+		print("%dx%d: %d bytes in %.3f seconds" % (size, size, len(data), time.time() - start))
@@ -7,11 +7,24 @@ import struct
 import os
 import math
 import sys
+import io
+import time
+import zlib
+import lzma
+import concurrent.futures
+import fnmatch
+import itertools
+import hashlib
+import shutil
 import bmesh
+import numpy
 from bpy_extras.io_utils import axis_conversion
 from bpy.props import *
 from mathutils import Vector, Quaternion, Matrix
 from . import struct_bf3d
+from . import tangent_bf3d
+from . import dds_bf3d
+from . import layout_bf3d
 
 #TODO 
 
@@ -91,7 +104,7 @@ def triangulate(mesh):
 # Mesh Sphere
 #######################################################################################
 
-def calcModelSphere(model):
+def calcModelSphere(model, testSphere = True):
 	objList = [object for object in bpy.context.scene.objects if object.type == 'MESH']
 	verts = []
 	for mesh_ob in objList: 
@@ -139,7 +152,8 @@ def calcModelSphere(model):
 	model.bSphere = s
 	
 	#for testing
-	createSphere(radius, m.x, m.y, m.z)
+	if testSphere:
+		createSphere(radius, m.x, m.y, m.z)
 	
 #######################################################################################
 # create Sphere (just for testing)
@@ -186,13 +200,14 @@ def WritePivots(file, pivots):
 	WriteInt(file, 258) #chunktype
 	WriteInt(file, getPivotsChunkSize(pivots)) #chunksize
 	
-	for pivot in pivots:
+	matrices = convertMatrices(pivots).astype('<f4')
+	for pivot, matrix in zip(pivots, matrices):
 		WriteString(file, pivot.name)
 		WriteInt(file, pivot.parent)
 		WriteUnsignedByte(file, pivot.isBone)
-		WriteMatrix(file, pivot.matrix)
+		file.write(matrix.tobytes())
 
-def WriteHierarchy(file, hierarchy):
+def WriteHierarchy(file, hierarchy, progress = None, compression = None):
 	print("\n### NEW HIERARCHY: ###")
 	WriteInt(file, 256) #chunktype
 	
@@ -204,7 +219,84 @@ def WriteHierarchy(file, hierarchy):
 	print("Header")
 	WritePivots(file, hierarchy.pivots)
 	print("Pivots")
+	if not progress == None:
+		progress(1, 1)
+
+#######################################################################################
+# Hierarchy Compiler
+#######################################################################################
 
+def CompileHierarchy(hierarchy, parentNames):
+	#orders the pivots depth first so every parent comes before its children and resolves the parent indices
+	#parentNames holds the name of the parent for every pivot, unknown parents are replaced by the first pivot (root)
+	#returns a lookup from pivot name to index and one from id(pivot) to index
+	#names may be shared by a bone and a mesh object, only the ids are unique
+	pivots = hierarchy.pivots
+	known = set(pivot.name for pivot in pivots)
+	children = {}
+	for pivot, parentName in zip(pivots[1:], parentNames[1:]):
+		if not parentName in known or parentName == pivot.name:
+			parentName = pivots[0].name
+		children.setdefault(parentName, []).append(pivot)
+
+	ordered = []
+	visited = set()
+	stack = [pivots[0]]
+	while len(stack) > 0:
+		pivot = stack.pop()
+		ordered.append(pivot)
+		if pivot.name in visited:
+			continue
+		visited.add(pivot.name)
+		stack.extend(reversed(children.get(pivot.name, [])))
+	#pivots caught in a parent cycle are not reachable from the root
+	reached = set(id(pivot) for pivot in ordered)
+	for pivot in pivots:
+		if not id(pivot) in reached:
+			ordered.append(pivot)
+
+	pivotIndices = {}
+	idIndices = {}
+	for index, pivot in enumerate(ordered):
+		pivotIndices.setdefault(pivot.name, index)
+		idIndices[id(pivot)] = index
+	parents = {id(pivot): parentName for pivot, parentName in zip(pivots, parentNames)}
+	for index, pivot in enumerate(ordered):
+		parent = pivotIndices.get(parents[id(pivot)], 0)
+		pivot.parent = parent if parent < index else (0 if index > 0 else -1)
+
+	hierarchy.pivots = ordered
+	hierarchy.header.pivotCount = len(ordered)
+	hierarchy.header.centerPos = calcHierarchyCenter(ordered)
+	return pivotIndices, idIndices
+
+def getPivotMatrices(pivots):
+	return numpy.array([[list(row) for row in pivot.matrix] for pivot in pivots], dtype = numpy.float64).reshape(-1, 4, 4)
+
+def calcHierarchyCenter(pivots):
+	#the center of the bounding box of all pivot positions
+	positions = getWorldMatrices(pivots)[:, 0:3, 3]
+	return Vector(((positions.min(axis = 0) + positions.max(axis = 0)) / 2.0).tolist())
+
+def getWorldMatrices(pivots):
+	#the world matrices of the compiled pivots, computed one depth level at a time
+	local = getPivotMatrices(pivots)
+	parents = numpy.array([pivot.parent for pivot in pivots], dtype = numpy.int32)
+	depth = numpy.zeros(len(pivots), dtype = numpy.int32)
+	for index in range(1, len(pivots)):
+		if parents[index] >= 0:
+			depth[index] = depth[parents[index]] + 1
+	world = local.copy()
+	for level in range(1, depth.max() + 1):
+		idx = numpy.nonzero(depth == level)[0]
+		world[idx] = numpy.matmul(world[parents[idx]], local[idx])
+	return world
+
+def convertMatrices(pivots):
+	#converts all pivot matrices from z up to y up at once, returns a (pivotCount, 4, 4) array
+	conversion = numpy.array([list(row) for row in global_matrix], dtype = numpy.float64)
+	return numpy.matmul(numpy.matmul(conversion, getPivotMatrices(pivots)), numpy.linalg.inv(conversion))
+		
 #######################################################################################
 # Animation
 #######################################################################################
@@ -238,7 +330,12 @@ def WriteTimeCodedAnimationChannel(file, channel):
 		WriteInt(file, int(key.frame))
 		WriteFloat(file, key.value)
 
-def WriteAnimation(file, animation):
+def WriteAnimation(file, animation, progress = None, compression = None):
+	if not compression == None:
+		file.write(encodeChunks(WriteAnimation, [animation], compression)[0])
+		if not progress == None:
+			progress(1, 1)
+		return
 	print("\n### NEW ANIMATION: ###")
 	WriteInt(file, 512) #chunktype
 	channelsSize = 0
@@ -248,8 +345,10 @@ def WriteAnimation(file, animation):
 	
 	WriteAnimationHeader(file, animation.header)
 	print("Header")
-	for channel in animation.channels:
+	for index, channel in enumerate(animation.channels):
 		WriteTimeCodedAnimationChannel(file, channel)
+		if not progress == None:
+			progress(index + 1, len(animation.channels))
 		
 #######################################################################################
 # Sphere
@@ -328,6 +427,33 @@ def WriteMeshFaceArray(file, faces):
 		WriteInt(file, face[1])
 		WriteInt(file, face[2])
 		
+#######################################################################################
+# Clusters
+#######################################################################################	
+
+def getMeshClustersChunkSize(clusters):
+	return 8 + len(clusters.firstFaces) * 36 + len(clusters.stream)
+
+def WriteMeshClusters(file, clusters):
+	WriteInt(file, 140) #chunktype
+	WriteInt(file, getMeshClustersChunkSize(clusters)) #chunksize
+
+	#the boxes are converted to y up like WriteVector
+	rotation = numpy.array([list(row) for row in global_matrix.to_3x3()])
+	boxMin = numpy.matmul(clusters.boxMin, rotation.T)
+	boxMax = numpy.matmul(clusters.boxMax, rotation.T)
+	data = numpy.empty(len(clusters.firstFaces), dtype = [('first', '<i4'), ('count', '<i4'), ('offset', '<i4'), ('min', '<f4', 3), ('max', '<f4', 3)])
+	data['first'] = clusters.firstFaces
+	data['count'] = clusters.faceCounts
+	data['offset'] = clusters.byteOffsets
+	data['min'] = numpy.minimum(boxMin, boxMax)
+	data['max'] = numpy.maximum(boxMin, boxMax)
+
+	WriteInt(file, len(data))
+	file.write(data.tobytes())
+	WriteInt(file, len(clusters.stream))
+	file.write(clusters.stream)
+		
 #######################################################################################
 # uvCoords
 #######################################################################################	
@@ -343,6 +469,24 @@ def WriteMeshUVCoords(file, uvCoords):
 		WriteFloat(file, uv[0])
 		WriteFloat(file, uv[1])
 		
+#######################################################################################
+# Tangents
+#######################################################################################	
+
+def getMeshTangentsChunkSize(tangents):
+	return len(tangents) * 16
+
+def WriteMeshTangents(file, tangents):
+	WriteInt(file, 139) #chunktype
+	WriteInt(file, getMeshTangentsChunkSize(tangents)) #chunksize
+
+	#per vertex: tangent (converted to y up like WriteVector) and bitangent sign
+	rotation = numpy.array([list(row) for row in global_matrix.to_3x3()])
+	data = numpy.empty((len(tangents), 4), dtype = '<f4')
+	data[:, 0:3] = numpy.matmul(tangents[:, 0:3], rotation.T)
+	data[:, 3] = tangents[:, 3]
+	file.write(data.tobytes())
+		
 #######################################################################################
 # VertexInfluences
 #######################################################################################	
@@ -359,6 +503,38 @@ def WriteMeshVertexInfluences(file, influences):
 		WriteInt(file, inf.boneIdx)
 		WriteInt(file, int(inf.boneInf * 100))
 		
+#######################################################################################
+# BonePalette
+#######################################################################################	
+
+def getMeshBonePaletteChunkSize(palette):
+	return len(palette) * 4
+
+def WriteMeshBonePalette(file, palette):
+	WriteInt(file, 137) #chunktype
+	WriteInt(file, getMeshBonePaletteChunkSize(palette)) #chunksize
+
+	for bone in palette:
+		WriteInt(file, bone)
+
+#######################################################################################
+# SkinWeights
+#######################################################################################	
+
+def getMeshSkinWeightsChunkSize(skinBones):
+	return 4 + skinBones.size * 8
+
+def WriteMeshSkinWeights(file, skinBones, skinWeights):
+	WriteInt(file, 138) #chunktype
+	WriteInt(file, getMeshSkinWeightsChunkSize(skinBones)) #chunksize
+
+	WriteInt(file, skinBones.shape[1])
+	#per vertex: (palette index, weight) for every influence
+	data = numpy.empty(skinBones.shape, dtype = [('bone', '<i4'), ('weight', '<f4')])
+	data['bone'] = skinBones
+	data['weight'] = skinWeights
+	file.write(data.tobytes())
+		
 #######################################################################################
 # Mesh
 #######################################################################################	
@@ -380,12 +556,23 @@ def WriteMeshHeader(file, header):
 	
 def getMeshChunkSize(mesh):
 	size = HEAD + getMeshHeaderChunkSize(mesh.header)
+	if not mesh.bBox == None:
+		size += HEAD + getBoxChunkSize(mesh.bBox)
+		size += HEAD + getSphereChunkSize(mesh.bSphere)
 	size += HEAD + getMeshVerticesChunkSize(mesh.verts)
 	size += HEAD + getMeshNormalsArrayChunkSize(mesh.normals)
-	size += HEAD + getMeshFaceArrayChunkSize(mesh.faces)
+	if mesh.clusters == None:
+		size += HEAD + getMeshFaceArrayChunkSize(mesh.faces)
+	else:
+		size += HEAD + getMeshClustersChunkSize(mesh.clusters)
 	size += HEAD + getMeshUVCoordsChunkSize(mesh.uvCoords)
+	if not mesh.tangents is None:
+		size += HEAD + getMeshTangentsChunkSize(mesh.tangents)
 	if len(mesh.vertInfs) > 0:
 		size += HEAD + getMeshVertexInfluencesChunkSize(mesh.vertInfs)
+	if len(mesh.bonePalette) > 0:
+		size += HEAD + getMeshBonePaletteChunkSize(mesh.bonePalette)
+		size += HEAD + getMeshSkinWeightsChunkSize(mesh.skinBones)
 	return size
 	
 def WriteMesh(file, mesh):
@@ -397,70 +584,928 @@ def WriteMesh(file, mesh):
 	WriteMeshHeader(file, mesh.header)
 	print(mesh.header.meshName)
 	#print("Header")
+	if not mesh.bBox == None:
+		WriteBox(file, mesh.bBox)
+		WriteSphere(file, mesh.bSphere)
 	WriteMeshVerticesArray(file, mesh.verts)
 	#print("Vertices")
 	WriteMeshNormalsArray(file, mesh.normals)
 	#print("Normals")
-	WriteMeshFaceArray(file, mesh.faces)
+	if mesh.clusters == None:
+		WriteMeshFaceArray(file, mesh.faces)
+	else:
+		WriteMeshClusters(file, mesh.clusters)
 	#print("Faces")
 	WriteMeshUVCoords(file, mesh.uvCoords)
 	#print("uvCoords")
+	if not mesh.tangents is None:
+		WriteMeshTangents(file, mesh.tangents)
 	if len(mesh.vertInfs) > 0:
 		WriteMeshVertexInfluences(file, mesh.vertInfs) 
 		#print("Vertex Influences")
+	if len(mesh.bonePalette) > 0:
+		WriteMeshBonePalette(file, mesh.bonePalette)
+		WriteMeshSkinWeights(file, mesh.skinBones, mesh.skinWeights)
+		
+#######################################################################################
+# Mesh BVH
+#######################################################################################
+
+def getMeshBVHChunkSize(bvh):
+	return 8 + len(bvh.nodes) * 32 + len(bvh.meshIndices) * 4
+
+def WriteMeshBVH(file, bvh):
+	print("\n### NEW MESH BVH: ###")
+	WriteInt(file, 194) #chunktype
+	WriteInt(file, getMeshBVHChunkSize(bvh)) #chunksize
+
+	#the boxes are already converted to y up
+	WriteInt(file, len(bvh.nodes))
+	for node in bvh.nodes:
+		for value in node.boxMin + node.boxMax:
+			WriteFloat(file, value)
+		WriteInt(file, node.child)
+		WriteInt(file, node.count)
+	WriteInt(file, len(bvh.meshIndices))
+	for index in bvh.meshIndices:
+		WriteInt(file, index)
+	
+#######################################################################################
+# Materials
+#######################################################################################
+
+def getMaterialsChunkSize(materials):
+	size = 0
+	for material in materials:
+		size += getStringSize(material.name) + getStringSize(material.texture)
+	return size
+
+def WriteMaterials(file, materials):
+	print("\n### NEW MATERIALS: ###")
+	WriteInt(file, 160) #chunktype
+	WriteInt(file, getMaterialsChunkSize(materials)) #chunksize
+
+	#the index of a material is its materialID
+	for material in materials:
+		WriteString(file, material.name)
+		WriteString(file, material.texture)
 		
 #######################################################################################
 # Model
 #######################################################################################
 
-def getModelChunkSize(model):
+def getModelChunkSize(model, meshChunks = None):
 	size = getStringSize(model.hieraName)
 	if not model.bBox == None:
 		size += getBoxChunkSize(model.bBox)
 	if not model.bSphere == None:
 		size += getSphereChunkSize(model.bSphere)
+	if not model.bvh == None:
+		size += getMeshBVHChunkSize(model.bvh)
+	if len(model.materials) > 0:
+		size += getMaterialsChunkSize(model.materials)
+	if not meshChunks == None:
+		for chunk in meshChunks:
+			size += len(chunk) - HEAD
+		return size
 	for mesh in model.meshes:
 		size += getMeshChunkSize(mesh)
 	return size
 
-def WriteModel(file, model):
+def WriteModel(file, model, progress = None, compression = None):
 	print("\n### NEW MODEL: ###")
+	meshChunks = None
+	if not compression == None:
+		meshChunks = encodeChunks(WriteMesh, model.meshes, compression)
 	WriteInt(file, 128) #chunktype
-	WriteInt(file, getModelChunkSize(model)) #chunksize
+	WriteInt(file, getModelChunkSize(model, meshChunks)) #chunksize
 
-	calcModelSphere(model)
 	print(model.hieraName)
 	WriteString(file, model.hieraName)
 	if not model.bBox == None:
 		WriteBox(file, model.bBox)
 	if not model.bSphere == None:
 		WriteSphere(file, model.bSphere)
+	if not model.bvh == None:
+		WriteMeshBVH(file, model.bvh)
+	if len(model.materials) > 0:
+		WriteMaterials(file, model.materials)
+	for index, mesh in enumerate(model.meshes):
+		if meshChunks == None:
+			WriteMesh(file, mesh)
+		else:
+			file.write(meshChunks[index])
+		if not progress == None:
+			progress(index + 1, len(model.meshes))
+		
+#######################################################################################
+# Skinning
+#######################################################################################
+
+def extractSkinWeights(mesh, mesh_ob, pivotIndices, maxInfluences):
+	#gathers all vertex group weights of the mesh at once and keeps the strongest maxInfluences per vertex
+	#returns two (vertCount, maxInfluences) arrays with the pivot indices and the normalized weights
+	vertCount = len(mesh.vertices)
+	groupPivots = numpy.full(len(mesh_ob.vertex_groups), -1, dtype = numpy.int32)
+	for group in mesh_ob.vertex_groups:
+		if group.name in pivotIndices:
+			groupPivots[group.index] = pivotIndices[group.name]
+
+	#(vertex, group, weight) of every influence in a single pass over the vertices
+	data = numpy.fromiter(itertools.chain.from_iterable((v.index, g.group, g.weight) for v in mesh.vertices for g in v.groups), dtype = numpy.float64).reshape(-1, 3)
+	verts = data[:, 0].astype(numpy.int32)
+	pivots = groupPivots[data[:, 1].astype(numpy.int32)]
+	weights = data[:, 2].astype(numpy.float32)
+
+	valid = (pivots >= 0) & (weights > 0.0)
+	verts = verts[valid]
+	pivots = pivots[valid]
+	weights = weights[valid]
+
+	#sort by vertex and descending weight, the rank is the position of an influence within its vertex
+	order = numpy.lexsort((-weights, verts))
+	verts = verts[order]
+	pivots = pivots[order]
+	weights = weights[order]
+	rank = numpy.arange(len(verts)) - numpy.searchsorted(verts, verts)
+	keep = rank < maxInfluences
+
+	skinBones = numpy.zeros((vertCount, maxInfluences), dtype = numpy.int32)
+	skinWeights = numpy.zeros((vertCount, maxInfluences), dtype = numpy.float32)
+	skinBones[verts[keep], rank[keep]] = pivots[keep]
+	skinWeights[verts[keep], rank[keep]] = weights[keep]
+
+	#vertices without any valid influence are bound to the roottransform
+	sums = skinWeights.sum(axis = 1)
+	unweighted = sums == 0.0
+	skinWeights[unweighted, 0] = 1.0
+	sums[unweighted] = 1.0
+	skinWeights /= sums[:, None]
+	return skinBones, skinWeights
+
+def getNearestBone(bone, bones, pivotParents):
+	#the first of the bones found walking up the hierarchy from bone, None if there is none
+	while bone >= 0:
+		if bone in bones:
+			return bone
+		bone = -1 if pivotParents == None else pivotParents[bone]
+	return None
+
+def limitFaceBones(faces, skinBones, skinWeights, maxBones, pivotParents = None):
+	#a face that references more than maxBones bones fits into no palette, so the weakest bones of such faces are dropped
+	#works in place on skinBones and skinWeights, returns the number of limited faces
+	used = numpy.where(skinWeights > 0.0, skinBones, -1)[faces].reshape(len(faces), -1)
+	used.sort(axis = 1)
+	distinct = ((used[:, 1:] != used[:, :-1]) & (used[:, 1:] >= 0)).sum(axis = 1) + (used[:, 0] >= 0)
+	limited = 0
+	for face in faces[distinct > maxBones]:
+		#an earlier face may already have dropped bones of these vertices
+		bones = skinBones[face]
+		weights = skinWeights[face]
+		candidates = numpy.unique(bones[weights > 0.0])
+		if len(candidates) <= maxBones:
+			continue
+		totals = numpy.array([weights[bones == bone].sum() for bone in candidates])
+		#the roottransform only comes from the fallback for unweighted vertices, real bones rank first
+		totals[candidates == 0] = -1.0
+		keep = candidates[numpy.argsort(-totals, kind = 'mergesort')[:maxBones]]
+		strongest = bones[numpy.arange(len(face)), numpy.argmax(weights, axis = 1)]
+		weights[~(bones[:, :, None] == keep).any(axis = 2)] = 0.0
+
+		#vertices without a kept influence are bound to the nearest kept parent of their strongest bone
+		keptBones = set(keep.tolist())
+		for row in numpy.nonzero(weights.sum(axis = 1) == 0.0)[0]:
+			bone = getNearestBone(int(strongest[row]), keptBones, pivotParents)
+			bones[row, 0] = keep[0] if bone == None else bone
+			weights[row, 0] = 1.0
+		#the strongest influence comes first again like in extractSkinWeights
+		order = numpy.argsort(-weights, axis = 1, kind = 'mergesort')
+		rows = numpy.arange(len(face))[:, None]
+		bones = bones[rows, order]
+		weights = weights[rows, order]
+		bones[weights == 0.0] = 0
+		skinBones[face] = bones
+		skinWeights[face] = weights / weights.sum(axis = 1)[:, None]
+		limited += 1
+	return limited
+
+def getBonePalettes(faces, skinBones, skinWeights, maxBones):
+	#assigns the faces to groups whose combined bone palette fits into maxBones
+	used = numpy.where(skinWeights > 0.0, skinBones, -1)
+	if maxBones <= 0 or len(numpy.unique(used[used >= 0])) <= maxBones:
+		return [numpy.arange(len(faces))]
+
+	#the sorted bone set of every face, duplicates are replaced by -1
+	faceBones = used[faces].reshape(len(faces), -1)
+	faceBones.sort(axis = 1)
+	faceBones[:, 1:][faceBones[:, 1:] == faceBones[:, :-1]] = -1
+	faceBones.sort(axis = 1)
+
+	#most faces share their bone set with many others, so the palettes are filled per unique set
+	rows = numpy.ascontiguousarray(faceBones).view(numpy.dtype((numpy.void, faceBones.dtype.itemsize * faceBones.shape[1])))
+	unique, first, inverse = numpy.unique(rows.ravel(), return_index = True, return_inverse = True)
+	boneSets = [set(bones) - {-1} for bones in faceBones[first].tolist()]
+
+	palettes = []
+	setPalettes = numpy.zeros(len(boneSets), dtype = numpy.int32)
+	#the largest sets first, the smaller ones fill the gaps
+	for index in sorted(range(len(boneSets)), key = lambda index: -len(boneSets[index])):
+		bones = boneSets[index]
+		for paletteIndex, palette in enumerate(palettes):
+			if len(palette | bones) <= maxBones:
+				palette |= bones
+				setPalettes[index] = paletteIndex
+				break
+		else:
+			setPalettes[index] = len(palettes)
+			palettes.append(set(bones))
+
+	facePalettes = setPalettes[inverse.ravel()]
+	order = numpy.argsort(facePalettes, kind = 'mergesort')
+	return numpy.split(order.astype(numpy.int32), numpy.cumsum(numpy.bincount(facePalettes, minlength = len(palettes)))[:-1])
+
+def splitSkinnedMesh(mesh, skinBones, skinWeights, maxBones, pivotParents = None):
+	#splits the mesh into sub meshes with their own bone palette and remaps the bone indices to it
+	#pivotParents holds the parent index of every pivot, it is used to rebind vertices that lost all their bones
+	faces = numpy.array(mesh.faces, dtype = numpy.int32).reshape(-1, 3)
+	if maxBones > 0:
+		limited = limitFaceBones(faces, skinBones, skinWeights, maxBones, pivotParents)
+		if limited > 0:
+			print("Warning: %d faces of %s use more than %d bones, their weakest influences were dropped" % (limited, mesh.header.meshName, maxBones))
+	faceGroups = getBonePalettes(faces, skinBones, skinWeights, maxBones)
+
+	subMeshes = []
+	for faceIdx in faceGroups:
+		used, inverse = numpy.unique(faces[faceIdx], return_inverse = True)
+		bones = skinBones[used]
+		weights = skinWeights[used]
+
+		subMesh = struct_bf3d.Mesh()
+		subMesh.header = struct_bf3d.MeshHeader()
+		subMesh.header.type = mesh.header.type
+		subMesh.header.meshName = mesh.header.meshName
+		if len(faceGroups) > 1:
+			subMesh.header.meshName += "_" + str(len(subMeshes))
+		subMesh.header.materialID = mesh.header.materialID
+		subMesh.header.parentPivot = mesh.header.parentPivot
+		subMesh.materialSlot = mesh.materialSlot
+		subMesh.verts = [mesh.verts[i] for i in used]
+		subMesh.normals = [mesh.normals[i] for i in used]
+		subMesh.uvCoords = [mesh.uvCoords[i] for i in used]
+		subMesh.faces = [tuple(face) for face in inverse.reshape(-1, 3).tolist()]
+		subMesh.header.vertCount = len(subMesh.verts)
+		subMesh.header.faceCount = len(subMesh.faces)
+
+		subMesh.bonePalette = numpy.unique(bones[weights > 0.0]).tolist()
+		local = numpy.searchsorted(subMesh.bonePalette, bones)
+		subMesh.skinBones = numpy.where(weights > 0.0, local, 0).astype(numpy.int32)
+		subMesh.skinWeights = weights
+
+		#the old influence chunk keeps the global pivot indices of the two strongest bones
+		subMesh.vertInfs = []
+		for b, w in zip(bones.tolist(), weights.tolist()):
+			vertInf = struct_bf3d.MeshVertexInfluences()
+			vertInf.boneIdx = b[0]
+			vertInf.boneInf = w[0]
+			if len(b) > 1:
+				vertInf.xtraIdx = b[1]
+				vertInf.xtraInf = w[1]
+			subMesh.vertInfs.append(vertInf)
+		subMeshes.append(subMesh)
+	return subMeshes
+		
+#######################################################################################
+# Animation Channels
+#######################################################################################
+
+def CollectAnimationChannels(action, objName, hierarchy, pivotIndices, firstFrame = 0):
+	#converts the fcurves of the action into animation channels, objName is the pivot for curves without a bone
+	#firstFrame is subtracted from the key frames, so the keys start at 0
+	channels = []
+	for fcu in action.fcurves:
+		channel = struct_bf3d.TimeCodedAnimationChannel()
+		if(fcu.extrapolation == "CONSTANT"):
+			channel.extrapolation = 1
+		elif(fcu.extrapolation == "BEIZIER"):
+			channel.extrapolation = 2
+		channel.type = fcu.array_index 
+
+		if (fcu.data_path.endswith("location")):
+			channel.type += 0
+		elif (fcu.data_path.endswith("rotation_quaternion")):
+			channel.type += 3
+		else:
+			print("ERROR!: that type of data_path is not supported yet!")
+			print(fcu.data_path)
+			continue
+		channel.timeCodedKeys = []
+		try:
+			pivotName = fcu.data_path.split('"')[1]
+		except:
+			pivotName = objName
+		if not pivotName in pivotIndices:
+			print("Warning: action", action.name, "animates", pivotName, "which is not a pivot, skipping", fcu.data_path)
+			continue
+		channel.pivot = pivotIndices[pivotName]
+		
+		#axis conversion is applied here
+		if channel.type == 1:
+			channel.type = 2
+		elif channel.type == 2:
+			channel.type = 1
+		elif channel.type == 5:
+			channel.type = 6
+		elif channel.type == 6:
+			channel.type = 5
+
+		for keyframe in fcu.keyframe_points:
+			key = struct_bf3d.TimeCodedAnimationKey()
+			key.frame = keyframe.co.x - firstFrame
+
+			if channel.type == 0:
+				key.value = keyframe.co.y - hierarchy.pivots[channel.pivot].matrix[0][3]
+			elif channel.type == 1:
+				key.value = keyframe.co.y - hierarchy.pivots[channel.pivot].matrix[2][3]
+			elif channel.type == 2:
+				key.value = -(keyframe.co.y - hierarchy.pivots[channel.pivot].matrix[1][3])
+			
+			elif channel.type == 3:
+				key.value = keyframe.co.y
+			elif channel.type == 4:
+				key.value = -keyframe.co.y
+			elif channel.type == 5:
+				key.value = -keyframe.co.y
+			elif channel.type == 6:
+				key.value = keyframe.co.y
+			else:
+				print("invalid animation channel type")
+			channel.timeCodedKeys.append(key)
+		channels.append(channel)
+	return channels
+
+def CollectActions(rig, actionFilter):
+	#all the actions animating bones of the rig whose name matches the filter
+	bones = set(bone.name for bone in rig.pose.bones)
+	actions = []
+	for action in bpy.data.actions:
+		if not fnmatch.fnmatchcase(action.name, actionFilter):
+			continue
+		for fcu in action.fcurves:
+			if fcu.data_path.startswith("pose.bones") and fcu.data_path.split('"')[1] in bones:
+				actions.append(action)
+				break
+	return actions
+		
+#######################################################################################
+# Mesh Bounds
+#######################################################################################
+
+def calcMeshBounds(mesh):
+	#axis aligned box and bounding sphere (around the box center) in the space of the parent pivot
+	positions = numpy.array(mesh.verts, dtype = numpy.float64).reshape(-1, 3)
+	if len(positions) == 0:
+		return
+	low = positions.min(axis = 0)
+	high = positions.max(axis = 0)
+	center = (low + high) / 2.0
+	mesh.bBox = struct_bf3d.Box()
+	mesh.bBox.center = Vector(center.tolist())
+	mesh.bBox.extend = Vector(((high - low) / 2.0).tolist())
+	mesh.bSphere = struct_bf3d.Sphere()
+	mesh.bSphere.center = Vector(center.tolist())
+	mesh.bSphere.radius = float(numpy.sqrt(((positions - center) ** 2).sum(axis = 1).max()))
+
+def getWorldBoxes(meshes, hierarchy):
+	#the y up world space boxes of the meshes as (meshCount, 2, 3) array of min and max
+	world = numpy.matmul(numpy.array([list(row) for row in global_matrix]), getWorldMatrices(hierarchy.pivots))
+	corners = numpy.array([[x, y, z, 1.0] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)])
+	boxes = numpy.zeros((len(meshes), 2, 3))
+	for index, mesh in enumerate(meshes):
+		if mesh.bBox == None:
+			continue
+		local = corners.copy()
+		local[:, 0:3] = local[:, 0:3] * numpy.array(mesh.bBox.extend[:]) + numpy.array(mesh.bBox.center[:])
+		points = numpy.matmul(world[mesh.header.parentPivot], local.T).T[:, 0:3]
+		boxes[index, 0] = points.min(axis = 0)
+		boxes[index, 1] = points.max(axis = 0)
+	return boxes
+
+def BuildMeshBVH(meshes, hierarchy, leafSize = 2):
+	#top down bvh over the world boxes of the meshes, split at the median of the longest axis
+	#the nodes are stored depth first, an inner node is followed by its left child and stores the index of its right child
+	bvh = struct_bf3d.MeshBVH()
+	bvh.nodes = []
+	bvh.meshIndices = []
+	boxes = getWorldBoxes(meshes, hierarchy)
+	centers = boxes.mean(axis = 1)
+
+	def build(indices):
+		node = struct_bf3d.MeshBVHNode()
+		node.boxMin = boxes[indices, 0].min(axis = 0).tolist()
+		node.boxMax = boxes[indices, 1].max(axis = 0).tolist()
+		bvh.nodes.append(node)
+		if len(indices) <= leafSize:
+			node.child = len(bvh.meshIndices)
+			node.count = len(indices)
+			bvh.meshIndices.extend(indices.tolist())
+			return
+		axis = numpy.argmax(centers[indices].max(axis = 0) - centers[indices].min(axis = 0))
+		indices = indices[numpy.argsort(centers[indices, axis], kind = 'mergesort')]
+		half = len(indices) // 2
+		build(indices[:half])
+		node.child = len(bvh.nodes)
+		node.count = 0
+		build(indices[half:])
+
+	if len(meshes) > 0:
+		build(numpy.arange(len(meshes)))
+	return bvh
+		
+#######################################################################################
+# Mesh Layout
+#######################################################################################
+
+def layoutMesh(mesh, clusterSize):
+	#sorts the triangles along a morton curve and the vertices by their first use, then splits the faces into clusters
+	#the faces are written as delta encoded index streams per cluster instead of the face array
+	vertexOrder, faces = layout_bf3d.sortTriangles(mesh.verts, mesh.faces)
+	order = vertexOrder.tolist()
+	mesh.verts = [mesh.verts[i] for i in order]
+	mesh.normals = [mesh.normals[i] for i in order]
+	mesh.uvCoords = [mesh.uvCoords[i] for i in order]
+	if len(mesh.vertInfs) > 0:
+		mesh.vertInfs = [mesh.vertInfs[i] for i in order]
+	if not mesh.skinBones is None:
+		mesh.skinBones = mesh.skinBones[vertexOrder]
+		mesh.skinWeights = mesh.skinWeights[vertexOrder]
+	if not mesh.tangents is None:
+		mesh.tangents = mesh.tangents[vertexOrder]
+	mesh.faces = [tuple(face) for face in faces.tolist()]
+
+	firsts, boxMin, boxMax = layout_bf3d.getClusterBounds(mesh.verts, faces, clusterSize)
+	mesh.clusters = struct_bf3d.MeshClusters()
+	mesh.clusters.firstFaces = firsts
+	mesh.clusters.faceCounts = numpy.diff(numpy.append(firsts, len(faces)))
+	mesh.clusters.boxMin = boxMin
+	mesh.clusters.boxMax = boxMax
+	mesh.clusters.stream, mesh.clusters.byteOffsets = layout_bf3d.encodeIndices(faces, firsts)
+		
+#######################################################################################
+# Static Batching
+#######################################################################################
+
+def getBatchKey(mesh, hierarchy):
+	#meshes can only share a draw call if they use the same material and are moved by the same pivot
+	return (mesh.header.materialID, hierarchy.pivots[mesh.header.parentPivot].parent)
+
+def batchStaticMeshes(model, hierarchy, maxVerts, excluded = []):
+	#merges all non-skinned meshes that share a material and a parent pivot into one mesh
+	#the vertices are transformed into the space of the parent pivot, the pivots of the merged
+	#meshes are kept so the indices in the hierarchy file stay valid
+	batches = {}
+	meshes = []
 	for mesh in model.meshes:
-		WriteMesh(file, mesh)
+		pivot = hierarchy.pivots[mesh.header.parentPivot]
+		if not mesh.header.type == 0 or pivot.name in excluded or mesh.header.vertCount > maxVerts:
+			meshes.append(mesh)
+			continue
+		key = getBatchKey(mesh, hierarchy)
+		if not key in batches:
+			batches[key] = [[]]
+		batch = batches[key][-1]
+		if sum(m.header.vertCount for m in batch) + mesh.header.vertCount > maxVerts:
+			batch = []
+			batches[key].append(batch)
+		batch.append(mesh)
+
+	merged = 0
+	for key, batchList in batches.items():
+		for batch in batchList:
+			if len(batch) == 1:
+				meshes.append(batch[0])
+				continue
+			meshes.append(mergeMeshes(batch, hierarchy, key[1], len(meshes)))
+			merged += len(batch)
+
+	stats = (len(model.meshes), len(meshes), merged)
+	model.meshes = meshes
+	return stats
+
+def mergeMeshes(batch, hierarchy, parentPivot, index):
+	Mesh = struct_bf3d.Mesh()
+	Mesh.header = struct_bf3d.MeshHeader()
+	Mesh.header.type = 0
+	Mesh.header.meshName = "BATCH_" + str(index) + "_" + batch[0].header.meshName
+	Mesh.header.materialID = batch[0].header.materialID
+	Mesh.header.parentPivot = parentPivot
+	Mesh.verts = []
+	Mesh.normals = []
+	Mesh.faces = []
+	Mesh.uvCoords = []
+	Mesh.vertInfs = []
+
+	for mesh in batch:
+		matrix = hierarchy.pivots[mesh.header.parentPivot].matrix
+		normalMatrix = matrix.to_3x3().inverted().transposed()
+		offset = len(Mesh.verts)
+		#mirrored pivots reverse the winding of the transformed triangles
+		mirrored = matrix.to_3x3().determinant() < 0.0
+		for vert in mesh.verts:
+			Mesh.verts.append(matrix * vert)
+		for norm in mesh.normals:
+			Mesh.normals.append((normalMatrix * norm).normalized())
+		for face in mesh.faces:
+			if mirrored:
+				Mesh.faces.append((face[0] + offset, face[2] + offset, face[1] + offset))
+			else:
+				Mesh.faces.append((face[0] + offset, face[1] + offset, face[2] + offset))
+		Mesh.uvCoords.extend(mesh.uvCoords)
+
+	Mesh.header.vertCount = len(Mesh.verts)
+	Mesh.header.faceCount = len(Mesh.faces)
+	return Mesh
+		
+#######################################################################################
+# Compression
+#######################################################################################
+
+codecs = {'ZLIB': 0, 'LZMA': 1}
+
+class ChunkCompression:
+	#settings and statistics of the compressed chunk wrapper
+	def __init__(self, codec, level, threshold):
+		self.codec = codec
+		self.level = level
+		self.threshold = threshold
+		self.rawSize = 0
+		self.packedSize = 0
+		self.encodeTime = 0.0
+
+	def report(self):
+		ratio = self.packedSize / max(self.rawSize, 1)
+		return "compression: %d -> %d bytes (ratio %.3f) in %.2f seconds" % (self.rawSize, self.packedSize, ratio, self.encodeTime)
+
+def getChunkCompression(COMPRESSION = 'NONE', COMPRESSION_LEVEL = 6, COMPRESSION_THRESHOLD = 4096):
+	if COMPRESSION == 'NONE':
+		return None
+	return ChunkCompression(codecs[COMPRESSION], COMPRESSION_LEVEL, COMPRESSION_THRESHOLD)
+
+def getCompressedChunkSize(chunk):
+	return 9 + len(chunk.payload)
+
+def WriteCompressedChunk(file, chunk):
+	WriteInt(file, 16) #chunktype
+	WriteInt(file, getCompressedChunkSize(chunk)) #chunksize
+
+	WriteInt(file, chunk.chunkType)
+	WriteInt(file, chunk.uncompressedSize)
+	WriteUnsignedByte(file, chunk.codec)
+	file.write(chunk.payload)
+
+def compressChunk(raw, compression):
+	#wraps an encoded chunk (including its head) into a compressed chunk
+	chunk = struct_bf3d.CompressedChunk()
+	chunk.chunkType = struct.unpack("<i", raw[0:4])[0]
+	chunk.uncompressedSize = len(raw) - HEAD
+	chunk.codec = compression.codec
+	if compression.codec == codecs['LZMA']:
+		chunk.payload = lzma.compress(raw[HEAD:], preset = compression.level)
+	else:
+		chunk.payload = zlib.compress(raw[HEAD:], compression.level)
+	buffer = io.BytesIO()
+	WriteCompressedChunk(buffer, chunk)
+	return buffer.getvalue()
+
+def encodeChunk(writer, data, compression):
+	buffer = io.BytesIO()
+	writer(buffer, data)
+	raw = buffer.getvalue()
+	if len(raw) - HEAD < compression.threshold:
+		return raw, raw
+	return raw, compressChunk(raw, compression)
+
+def encodeChunks(writer, items, compression):
+	#the codecs release the GIL, so the chunks are compressed in parallel
+	start = time.time()
+	with concurrent.futures.ThreadPoolExecutor() as pool:
+		results = list(pool.map(lambda data: encodeChunk(writer, data, compression), items))
+	compression.encodeTime += time.time() - start
+	for raw, encoded in results:
+		compression.rawSize += len(raw)
+		compression.packedSize += len(encoded)
+	return [encoded for raw, encoded in results]
+		
+#######################################################################################
+# Materials
+#######################################################################################
+
+defaultTexture = "default_tex.dds"
+
+def getMaterialImage(material):
+	#the first image texture of the material (node tree or texture slots)
+	if material.use_nodes and not material.node_tree == None:
+		for node in material.node_tree.nodes:
+			if node.type == 'TEX_IMAGE' and not node.image == None:
+				return node.image
+	for slot in material.texture_slots:
+		if not slot == None and not slot.texture == None and slot.texture.type == 'IMAGE' and not slot.texture.image == None:
+			return slot.texture.image
+	return None
+
+def CollectMaterial(mesh_ob, slotIndex, model, materialIndices, images):
+	#returns the material id of a material slot of the object, material 0 is the default material
+	if len(model.materials) == 0:
+		material = struct_bf3d.Material()
+		material.name = "DEFAULT"
+		material.texture = defaultTexture
+		model.materials.append(material)
+	if slotIndex >= len(mesh_ob.material_slots) or mesh_ob.material_slots[slotIndex].material == None:
+		return 0
+	slotMaterial = mesh_ob.material_slots[slotIndex].material
+	if not slotMaterial.name in materialIndices:
+		materialIndices[slotMaterial.name] = len(model.materials)
+		material = struct_bf3d.Material()
+		material.name = slotMaterial.name
+		material.texture = defaultTexture
+		model.materials.append(material)
+		images.append(getMaterialImage(slotMaterial))
+	return materialIndices[slotMaterial.name]
+
+def splitMeshByMaterial(mesh, faceSlots):
+	#splits the mesh into one mesh per used material slot
+	#returns (mesh, vertex indices into the given mesh) pairs, the indices are None if the mesh is not split
+	slots = numpy.unique(faceSlots)
+	if len(slots) <= 1:
+		mesh.materialSlot = int(slots[0]) if len(slots) > 0 else 0
+		return [(mesh, None)]
+
+	faces = numpy.array(mesh.faces, dtype = numpy.int32).reshape(-1, 3)
+	parts = []
+	for slot in slots.tolist():
+		used, inverse = numpy.unique(faces[faceSlots == slot], return_inverse = True)
+		subMesh = struct_bf3d.Mesh()
+		subMesh.header = struct_bf3d.MeshHeader()
+		subMesh.header.type = mesh.header.type
+		subMesh.header.meshName = mesh.header.meshName + "_" + str(slot)
+		subMesh.header.parentPivot = mesh.header.parentPivot
+		subMesh.verts = [mesh.verts[i] for i in used]
+		subMesh.normals = [mesh.normals[i] for i in used]
+		subMesh.uvCoords = [mesh.uvCoords[i] for i in used]
+		subMesh.faces = [tuple(face) for face in inverse.reshape(-1, 3).tolist()]
+		subMesh.vertInfs = []
+		subMesh.bonePalette = []
+		subMesh.header.vertCount = len(subMesh.verts)
+		subMesh.header.faceCount = len(subMesh.faces)
+		subMesh.materialSlot = slot
+		parts.append((subMesh, used))
+	return parts
+
+#######################################################################################
+# Textures
+#######################################################################################
+
+#bump this when the encoder output changes, it is part of the cache key
+textureEncoderVersion = b"bf3d dds 1"
+
+def getImagePixels(image):
+	#the pixels as (height, width, 4) uint8 array with the top row first, None if the image has no data
+	width, height = image.size
+	pixels = numpy.array(image.pixels[:], dtype = numpy.float32)
+	if width == 0 or height == 0 or not len(pixels) == width * height * 4:
+		return None
+	pixels = pixels.reshape(height, width, 4)[::-1]
+	return (numpy.clip(pixels, 0.0, 1.0) * 255.0 + 0.5).astype(numpy.uint8)
+
+def getImageHash(image, mipmaps, imageHashes = None):
+	#hashes the source file if there is one, otherwise the pixels
+	#images edited in blender and not saved yet differ from their file, so their pixels are hashed
+	#imageHashes keeps the digests of source files by path, size and mtime between exports
+	digest = hashlib.sha1(textureEncoderVersion + (b"mip" if mipmaps else b""))
+	path = bpy.path.abspath(image.filepath)
+	if not image.is_dirty and not image.packed_file == None:
+		digest.update(image.packed_file.data)
+	elif not image.is_dirty and os.path.isfile(path):
+		stat = os.stat(path)
+		key = (path, stat.st_size, stat.st_mtime, mipmaps)
+		if not imageHashes == None and key in imageHashes:
+			return imageHashes[key]
+		with open(path, "rb") as source:
+			digest.update(source.read())
+		if not imageHashes == None:
+			imageHashes[key] = digest.hexdigest()
+	else:
+		pixels = getImagePixels(image)
+		if pixels is None:
+			return None
+		digest.update(str(pixels.shape).encode())
+		digest.update(pixels.tobytes())
+	return digest.hexdigest()
+
+def CollectTextures(model, images, exportDir, mipmaps, imageHashes = None):
+	#returns the texture jobs (outputPath, cachePath, pixels, mipmaps) for WriteTextures, pixels is None if the cached file can be copied
+	cacheDir = os.path.join(exportDir, ".bf3d_texture_cache")
+	if not os.path.isdir(cacheDir):
+		os.makedirs(cacheDir)
+	jobs = [(os.path.join(exportDir, defaultTexture), os.path.join(os.path.dirname(__file__), defaultTexture), None, False)]
+	encoded = 0
+	queued = {}
+	for material, image in zip(model.materials[1:], images):
+		if image == None:
+			continue
+		digest = getImageHash(image, mipmaps, imageHashes)
+		if digest == None:
+			print("Warning: image", image.name, "has no data, using", defaultTexture)
+			continue
+		cachePath = os.path.join(cacheDir, digest + ".dds")
+		pixels = None
+		if not os.path.isfile(cachePath):
+			pixels = getImagePixels(image)
+			if pixels is None:
+				print("Warning: image", image.name, "has no data, using", defaultTexture)
+				continue
+		material.texture = bpy.path.clean_name(os.path.splitext(image.name)[0]) + ".dds"
+		if material.texture in queued and not queued[material.texture] == cachePath:
+			material.texture = material.texture[:-4] + "_" + digest[:8] + ".dds"
+		if material.texture in queued:
+			continue
+		queued[material.texture] = cachePath
+		if not pixels is None:
+			encoded += 1
+		jobs.append((os.path.join(exportDir, material.texture), cachePath, pixels, mipmaps))
+	print("Textures:", len(jobs) - 1, "images,", encoded, "to encode")
+	return jobs
+
+def isSameFile(path, otherPath):
+	#compares the content, the size does not change with the image and the copy has a fresh mtime
+	if not os.path.isfile(path) or not os.path.getsize(path) == os.path.getsize(otherPath):
+		return False
+	with open(path, "rb") as file, open(otherPath, "rb") as otherFile:
+		return file.read() == otherFile.read()
+
+def WriteTextures(path, jobs, progress = None, compression = None):
+	#encodes the textures missing in the cache in parallel and copies them next to the model
+	def write(job):
+		outputPath, cachePath, pixels, mipmaps = job
+		if not pixels is None:
+			#images with the same content may be encoded twice at the same time, so the temp file is unique per job
+			tmpPath = cachePath + "." + os.path.basename(outputPath) + ".tmp"
+			with open(tmpPath, "wb") as file:
+				file.write(dds_bf3d.encodeDDS(pixels, mipmaps))
+			os.replace(tmpPath, cachePath)
+		#skip the copy if the texture next to the model already has the same content
+		if isSameFile(outputPath, cachePath):
+			return
+		shutil.copyfile(cachePath, outputPath + ".tmp")
+		os.replace(outputPath + ".tmp", outputPath)
+
+	with concurrent.futures.ThreadPoolExecutor() as pool:
+		for index, result in enumerate(pool.map(write, jobs)):
+			if not progress == None:
+				progress(index + 1, len(jobs))
+		
+#######################################################################################
+# Export Files
+#######################################################################################
+
+class ExportCancelled(Exception):
+	pass
+
+def WriteExportFiles(files, progress = None, compression = None):
+	#every file is written to a temp file first and renamed when it is complete
+	#progress is called with the finished fraction of all files and may raise ExportCancelled
+	for index, (path, name, writer, data) in enumerate(files):
+		fileProgress = None
+		if not progress == None:
+			fileProgress = lambda done, total, index = index: progress((index + done / max(total, 1)) / len(files))
+		if name == None:
+			#not a bf3d file, the writer takes care of its own files
+			writer(path, data, fileProgress, compression)
+			continue
+		tmpPath = path + ".tmp"
+		file = open(tmpPath, "wb")
+		try:
+			WriteBF3D(file, name)
+			writer(file, data, fileProgress, compression)
+			file.close()
+			os.replace(tmpPath, path)
+		except:
+			file.close()
+			os.remove(tmpPath)
+			raise
 		
 #######################################################################################
 # Main Export
 #######################################################################################
 
-def MainExport(givenfilepath, self, context, EXPORT_MODE = 'M'):
+class MeshCache:
+	#the meshes of the last export by object name, lets the live link skip unchanged objects
+	def __init__(self):
+		self.pivots = None
+		self.meshes = {}
+
+def CollectMesh(mesh_ob, pivotIndices, parentPivot, SKIN_MAX_INFLUENCES, SKIN_MAX_BONES, splitMaterials = False, pivotParents = None):
+	#returns the meshes of the object, skinned objects may be split into several meshes
+	#parentPivot is the index of the own pivot of a non-skinned object
+	#with splitMaterials the object is split into one mesh per used material slot first
+	Mesh = struct_bf3d.Mesh()
+	Mesh.header = struct_bf3d.MeshHeader()
+	Mesh.verts = []
+	Mesh.normals = [] 
+	Mesh.faces = []
+	Mesh.uvCoords = []
+	Mesh.vertInfs = []
+	Mesh.bonePalette = []
+
+	Mesh.header.meshName = mesh_ob.name
+	mesh = mesh_ob.to_mesh(bpy.context.scene, False, 'PREVIEW', calc_tessface = True)
+
+	triangulate(mesh)
+
+	Mesh.header.vertCount = len(mesh.vertices)
+  
+	for face in mesh.polygons:
+		Mesh.faces.append((face.vertices[0], face.vertices[1], face.vertices[2]))
+
+	Mesh.header.faceCount = len(Mesh.faces)
+
+	for v in mesh.vertices:
+		Mesh.verts.append(v.co.xyz)
+		Mesh.normals.append(v.normal.copy())
+		Mesh.uvCoords.append((0.0, 0.0)) #just to fill the array 
+
+	#uv coords
+	bm = bmesh.new()
+	bm.from_mesh(mesh)
+
+	uv_layer = bm.loops.layers.uv.verify() 
+
+	index = 0
+	for f in bm.faces:
+		#test if we need this 1- at all meshes
+		Mesh.uvCoords[Mesh.faces[index][0]] = (f.loops[0][uv_layer].uv[0], 1 - f.loops[0][uv_layer].uv[1])
+		Mesh.uvCoords[Mesh.faces[index][1]] = (f.loops[1][uv_layer].uv[0], 1 - f.loops[1][uv_layer].uv[1])
+		Mesh.uvCoords[Mesh.faces[index][2]] = (f.loops[2][uv_layer].uv[0], 1 - f.loops[2][uv_layer].uv[1])
+		index+=1   
+	del bm
+	
+	if len(mesh_ob.vertex_groups) > 0:
+		Mesh.header.type = 128 #type skin
+	else:
+		Mesh.header.type = 0 #type normal mesh
+		Mesh.header.parentPivot = parentPivot
+
+	faceSlots = numpy.zeros(len(Mesh.faces), dtype = numpy.int32)
+	if splitMaterials:
+		faceSlots = numpy.fromiter((face.material_index for face in mesh.polygons), dtype = numpy.int32, count = len(Mesh.faces))
+	parts = splitMeshByMaterial(Mesh, faceSlots)
+
+	if len(mesh_ob.vertex_groups) > 0:
+		skinBones, skinWeights = extractSkinWeights(mesh, mesh_ob, pivotIndices, SKIN_MAX_INFLUENCES)
+		meshes = []
+		for part, used in parts:
+			if used is None:
+				meshes.extend(splitSkinnedMesh(part, skinBones, skinWeights, SKIN_MAX_BONES, pivotParents))
+			else:
+				meshes.extend(splitSkinnedMesh(part, skinBones[used], skinWeights[used], SKIN_MAX_BONES, pivotParents))
+	else:
+		meshes = [part for part, used in parts]
+	#everything is copied out, the temporary mesh would stay in bpy.data otherwise
+	bpy.data.meshes.remove(mesh)
+	return meshes
+
+def MainExport(givenfilepath, self, context, COMPRESSION = 'NONE', COMPRESSION_LEVEL = 6, COMPRESSION_THRESHOLD = 4096, **keywords):
+	compression = getChunkCompression(COMPRESSION, COMPRESSION_LEVEL, COMPRESSION_THRESHOLD)
+	files = CollectExport(givenfilepath, self, context, **keywords)
+	WriteExportFiles(files, None, compression)
+	if not compression == None:
+		context.report({'INFO'}, compression.report())
+		print(compression.report())
+
+def CollectExport(givenfilepath, self, context, EXPORT_MODE = 'M', STATIC_BATCHING = False, BATCH_MAX_VERTS = 65535, SKIN_MAX_INFLUENCES = 2, SKIN_MAX_BONES = 0, ALL_ACTIONS = False, ACTION_FILTER = "*", MESH_BOUNDS = True, TANGENTS = True, TEXTURES = False, TEXTURE_MIPMAPS = True, MESH_LAYOUT = False, CLUSTER_SIZE = 64, meshCache = None, changed = None, imageHashes = None):
+	#gathers all the data from the scene, returns a list of (path, name, writer, data) for WriteExportFiles
 	#print("Run Export")
+	files = []
 	fileName = os.path.splitext(os.path.basename(givenfilepath))[0]
 	Hierarchy = struct_bf3d.Hierarchy()
 	Animation = struct_bf3d.Animation()
+	Hierarchy.header = struct_bf3d.HierarchyHeader()
 	Hierarchy.pivots = []
 	amtName = ""
 	modelName = ""
-	pivotsList = []
  
 	roottransform = struct_bf3d.HierarchyPivot()
 	roottransform.name = "ROOTTRANSFORM"
-	pivotsList.append(roottransform.name)
 	roottransform.matrix = Matrix()
 	roottransform.parent = -1
 	Hierarchy.pivots.append(roottransform)
+	parentNames = [None]
 	
 	#switch to object mode
-	if bpy.ops.object.mode_set.poll():
+	if not meshCache == None:
+		#the live link must not leave edit mode, it only takes the current state of the edited mesh
+		if not bpy.context.edit_object == None:
+			bpy.context.edit_object.update_from_editmode()
+	elif bpy.ops.object.mode_set.poll():
 		bpy.ops.object.mode_set(mode='OBJECT')
 
 	# Get all the armatures in the scene.
@@ -473,13 +1518,9 @@ def MainExport(givenfilepath, self, context, EXPORT_MODE = 'M'):
 		for bone in rig.pose.bones:
 			pivot = struct_bf3d.HierarchyPivot()
 			pivot.name = bone.name
-			pivotsList.append(bone.name)
-			pivot.parent = 0
 			pivot.matrix = bone.matrix_basis.copy()
-			if not bone.parent == None:
-				ids = [index for index, pivot in enumerate(Hierarchy.pivots) if pivot.name == bone.parent.name] #return an array of indices (in this case only one value)
-				pivot.parent = ids[0]
 			Hierarchy.pivots.append(pivot)
+			parentNames.append(None if bone.parent == None else bone.parent.name)
 			
 	if len(rigList) > 1:
 		context.report({'ERROR'}, "only one armature allowed!")
@@ -488,6 +1529,28 @@ def MainExport(givenfilepath, self, context, EXPORT_MODE = 'M'):
 	objList = []
 	# Get all the mesh objects in the scene.
 	objList = [object for object in bpy.context.scene.objects if object.type == 'MESH']
+
+	#every non-skinned mesh gets its own pivot
+	meshPivots = {}
+	for mesh_ob in objList:
+		if mesh_ob.name == "BOUNDINGBOX" or len(mesh_ob.vertex_groups) > 0:
+			continue
+		pivot = struct_bf3d.HierarchyPivot()
+		pivot.name = mesh_ob.name
+		pivot.isBone = 0
+		pivot.matrix = mesh_ob.matrix_basis.copy()
+		Hierarchy.pivots.append(pivot)
+		meshPivots[mesh_ob.name] = pivot
+		if not mesh_ob.parent_bone == "":
+			parentNames.append(mesh_ob.parent_bone)
+		elif not mesh_ob.parent == None:
+			parentNames.append(mesh_ob.parent.name)
+		else:
+			parentNames.append(None)
+
+	pivotIndices, idIndices = CompileHierarchy(Hierarchy, parentNames)
+	meshPivotIndices = {name: idIndices[id(pivot)] for name, pivot in meshPivots.items()}
+	pivotParents = [pivot.parent for pivot in Hierarchy.pivots]
  
 	modelName = fileName
 
@@ -495,190 +1558,103 @@ def MainExport(givenfilepath, self, context, EXPORT_MODE = 'M'):
 	Model.name = modelName
 	Model.hieraName = amtName
 	Model.meshes = []
-
-	for mesh_ob in objList: 
-		if mesh_ob.name == "BOUNDINGBOX":
-			Box = struct_bf3d.Box()
-			Box.center = (mesh_ob.matrix_world * Vector(mesh_ob.bound_box[0]) + mesh_ob.matrix_world * Vector(mesh_ob.bound_box[6])) / 2.0
-			Box.extend = Box.center - mesh_ob.matrix_world * Vector(mesh_ob.bound_box[0])
-			Model.bBox = Box
-		else:
-			Mesh = struct_bf3d.Mesh()
-			Mesh.header = struct_bf3d.MeshHeader()
-			Mesh.verts = []
-			Mesh.normals = [] 
-			Mesh.faces = []
-			Mesh.uvCoords = []
-			Mesh.vertInfs = []
-
-			Mesh.header.meshName = mesh_ob.name
-			mesh = mesh_ob.to_mesh(bpy.context.scene, False, 'PREVIEW', calc_tessface = True)
-
-			triangulate(mesh)
-
-			Mesh.header.vertCount = len(mesh.vertices)
-  
-			group_lookup = {g.index: g.name for g in mesh_ob.vertex_groups}
-			groups = {name: [] for name in group_lookup.values()}
-
-			for face in mesh.polygons:
-				Mesh.faces.append((face.vertices[0], face.vertices[1], face.vertices[2]))
-
-			Mesh.header.faceCount = len(Mesh.faces)
-
-			for v in mesh.vertices:
-				Mesh.verts.append(v.co.xyz)
-				Mesh.normals.append(v.normal)
-				Mesh.uvCoords.append((0.0, 0.0)) #just to fill the array 
-
-				#vertex influences
-				vertInf = struct_bf3d.MeshVertexInfluences()
-				if len(v.groups) == 1:
-					#has to be this complicated, otherwise the vertex groups would be corrupted
-					ids = [index for index, pivot in enumerate(Hierarchy.pivots) if pivot.name == mesh_ob.vertex_groups[v.groups[0].group].name] #return an array of indices (in this case only one value)
-					if len(ids) > 0:
-						vertInf.boneIdx = ids[0]
-					vertInf.boneInf = v.groups[0].weight
-					Mesh.vertInfs.append(vertInf)
-				elif len(v.groups) == 2:
-					#has to be this complicated, otherwise the vertex groups would be corrupted
-					ids = [index for index, pivot in enumerate(Hierarchy.pivots) if pivot.name == mesh_ob.vertex_groups[v.groups[0].group].name] #return an array of indices (in this case only one value)
-					if len(ids) > 0:
-						vertInf.boneIdx = ids[0]
-					vertInf.boneInf = v.groups[0].weight
-					#has to be this complicated, otherwise the vertex groups would be corrupted
-					ids = [index for index, pivot in enumerate(Hierarchy.pivots) if pivot.name == mesh_ob.vertex_groups[v.groups[1].group].name] #return an array of indices (in this case only one value)
-					if len(ids) > 0:
-						vertInf.xtraIdx = ids[0]
-					vertInf.xtraInf = v.groups[1].weight
-					Mesh.vertInfs.append(vertInf)
-				elif len(v.groups) > 2: 
-					context.report({'ERROR'}, "max 2 bone influences per vertex supported!")
-					print("Error: max 2 bone influences per vertex supported!")
-
-			#uv coords
-			bm = bmesh.new()
-			bm.from_mesh(mesh)
-
-			uv_layer = bm.loops.layers.uv.verify() 
-
-			index = 0
-			for f in bm.faces:
-				#test if we need this 1- at all meshes
-				Mesh.uvCoords[Mesh.faces[index][0]] = (f.loops[0][uv_layer].uv[0], 1 - f.loops[0][uv_layer].uv[1])
-				Mesh.uvCoords[Mesh.faces[index][1]] = (f.loops[1][uv_layer].uv[0], 1 - f.loops[1][uv_layer].uv[1])
-				Mesh.uvCoords[Mesh.faces[index][2]] = (f.loops[2][uv_layer].uv[0], 1 - f.loops[2][uv_layer].uv[1])
-				index+=1   
-			del bm
-			
-			if len(mesh_ob.vertex_groups) > 0:
-				Mesh.header.type = 128 #type skin
-			else:
-				Mesh.header.type = 0 #type normal mesh
-				pivot = struct_bf3d.HierarchyPivot()
-				pivot.name = mesh_ob.name
-				pivotsList.append(mesh_ob.name)
-				pivot.isBone = 0
-				pivot.matrix = mesh_ob.matrix_basis
-				if not mesh_ob.parent_bone == "":
-					ids = [index for index, pivot in enumerate(Hierarchy.pivots) if pivot.name == mesh_ob.parent_bone] #return an array of indices (in this case only one value)
-					pivot.parent = ids[0]
-				elif not mesh_ob.parent == None:
-					ids = [index for index, pivot in enumerate(Hierarchy.pivots) if pivot.name == mesh_ob.parent.name] #return an array of indices (in this case only one value)
-					pivot.parent = ids[0]
-				pivot.isBone = 0
-				Mesh.header.parentPivot = len(Hierarchy.pivots)
-				Hierarchy.pivots.append(pivot)
-
-			Model.meshes.append(Mesh)
+	Model.materials = []
+	materialIndices = {}
+	images = []
 
 	if EXPORT_MODE == 'M':
-		sknFile = open(givenfilepath, "wb")
-		WriteBF3D(sknFile, fileName)
-		WriteModel(sknFile, Model)
-		sknFile.close()
+		if not meshCache == None:
+			#skinned meshes store pivot indices, so the cache is only valid for the same hierarchy
+			pivots = [(pivot.name, pivot.parent) for pivot in Hierarchy.pivots]
+			if not meshCache.pivots == pivots:
+				meshCache.pivots = pivots
+				meshCache.meshes = {}
+
+		for mesh_ob in objList: 
+			if mesh_ob.name == "BOUNDINGBOX":
+				Box = struct_bf3d.Box()
+				Box.center = (mesh_ob.matrix_world * Vector(mesh_ob.bound_box[0]) + mesh_ob.matrix_world * Vector(mesh_ob.bound_box[6])) / 2.0
+				Box.extend = Box.center - mesh_ob.matrix_world * Vector(mesh_ob.bound_box[0])
+				Model.bBox = Box
+				continue
+			if not meshCache == None and mesh_ob.name in meshCache.meshes and not mesh_ob.name in changed:
+				meshes = meshCache.meshes[mesh_ob.name]
+			else:
+				meshes = CollectMesh(mesh_ob, pivotIndices, meshPivotIndices.get(mesh_ob.name, 0), SKIN_MAX_INFLUENCES, SKIN_MAX_BONES, TEXTURES, pivotParents)
+				if not meshCache == None:
+					meshCache.meshes[mesh_ob.name] = meshes
+			if TEXTURES:
+				for mesh in meshes:
+					mesh.header.materialID = CollectMaterial(mesh_ob, mesh.materialSlot, Model, materialIndices, images)
+			Model.meshes.extend(meshes)
+
+		if not meshCache == None:
+			#forget the deleted objects
+			names = set(mesh_ob.name for mesh_ob in objList)
+			meshCache.meshes = {name: meshes for name, meshes in meshCache.meshes.items() if name in names}
+
+		if STATIC_BATCHING:
+			#animated pivots have to keep their own mesh
+			animated = [obj.name for obj in objList if not obj.animation_data == None and not obj.animation_data.action == None]
+			meshCount, batchCount, merged = batchStaticMeshes(Model, Hierarchy, BATCH_MAX_VERTS, animated)
+			context.report({'INFO'}, "static batching: %d meshes -> %d meshes (%d merged)" % (meshCount, batchCount, merged))
+			print("Static batching: %d meshes -> %d meshes (%d merged)" % (meshCount, batchCount, merged))
+		if MESH_LAYOUT:
+			for mesh in Model.meshes:
+				if mesh.clusters == None: #already sorted if cached by the live link
+					layoutMesh(mesh, CLUSTER_SIZE)
+		if TANGENTS:
+			#computed on the final vertex arrays, so they match the exported uv coords
+			for mesh in Model.meshes:
+				if not mesh.tangents is None:
+					continue #cached by the live link
+				mesh.tangents = tangent_bf3d.calcTangents(mesh.verts, mesh.normals, mesh.uvCoords, mesh.faces)
+		if MESH_BOUNDS:
+			for mesh in Model.meshes:
+				calcMeshBounds(mesh)
+			Model.bvh = BuildMeshBVH(Model.meshes, Hierarchy)
+		#the live link must not add objects to the scene
+		calcModelSphere(Model, meshCache == None)
+		files.append((givenfilepath, fileName, WriteModel, Model))
+		if TEXTURES:
+			exportDir = os.path.dirname(os.path.abspath(givenfilepath))
+			files.append((exportDir, None, WriteTextures, CollectTextures(Model, images, exportDir, TEXTURE_MIPMAPS, imageHashes)))
 
-	Hierarchy.header.pivotCount = len(Hierarchy.pivots)
 	
-	if EXPORT_MODE == 'A':
+	if EXPORT_MODE == 'A' and ALL_ACTIONS:
+		if len(rigList) == 1:
+			#one file per action, the hierarchy and the pivot lookup are shared by all of them
+			for action in CollectActions(rigList[0], ACTION_FILTER):
+				frame_begin, frame_end = [int(x) for x in action.frame_range]
+				actionAnimation = struct_bf3d.Animation()
+				actionAnimation.header = struct_bf3d.AnimationHeader()
+				actionAnimation.header.name = action.name
+				actionAnimation.header.hieraName = amtName
+				actionAnimation.header.frameRate = bpy.context.scene.render.fps
+				actionAnimation.header.numFrames = frame_end - frame_begin
+				actionAnimation.channels = CollectAnimationChannels(action, amtName, Hierarchy, pivotIndices, frame_begin)
+				actionName = fileName + "_" + bpy.path.clean_name(action.name)
+				actionPath = os.path.join(os.path.dirname(givenfilepath), actionName + os.path.splitext(givenfilepath)[1])
+				files.append((actionPath, actionName, WriteAnimation, actionAnimation))
+			print("Collected", len(files), "actions")
+	elif EXPORT_MODE == 'A':
 		if len(rigList) == 1: #could also be 0?
 			Animation.header = struct_bf3d.AnimationHeader()
 			Animation.header.hieraName = amtName
-			Animation.header.frameRate = bpy.data.scenes["Scene"].render.fps
-			Animation.header.numFrames = bpy.data.scenes["Scene"].frame_end - bpy.data.scenes["Scene"].frame_start
+			Animation.header.frameRate = bpy.context.scene.render.fps
+			Animation.header.numFrames = bpy.context.scene.frame_end - bpy.context.scene.frame_start
 			Animation.channels = []
 			for obj in bpy.data.objects:
 				if obj.animation_data == None:
 					continue
 				action = obj.animation_data.action
-				frame_begin, frame_end = [int(x) for x in action.frame_range]
-
-				for fcu in action.fcurves:
-					channel = struct_bf3d.TimeCodedAnimationChannel()
-					if(fcu.extrapolation == "CONSTANT"):
-						channel.extrapolation = 1
-					elif(fcu.extrapolation == "BEIZIER"):
-						channel.extrapolation = 2
-					channel.type = fcu.array_index 
-
-					if (fcu.data_path.endswith("location")):
-						channel.type += 0
-					elif (fcu.data_path.endswith("rotation_quaternion")):
-						channel.type += 3
-					else:
-						print("ERROR!: that type of data_path is not supported yet!")
-						print(fcu.data_path)
-						continue
-					channel.timeCodedKeys = []
-					try:
-						pivotName = fcu.data_path.split('"')[1]
-					except:
-						pivotName = obj.name
-					channel.pivot = pivotsList.index(pivotName)
-					
-					#axis conversion is applied here
-					if channel.type == 1:
-						channel.type = 2
-					elif channel.type == 2:
-						channel.type = 1
-					elif channel.type == 5:
-						channel.type = 6
-					elif channel.type == 6:
-						channel.type = 5
-
-					for keyframe in fcu.keyframe_points:
-						key = struct_bf3d.TimeCodedAnimationKey()
-						key.frame = keyframe.co.x
-
-						if channel.type == 0:
-							key.value = keyframe.co.y - Hierarchy.pivots[channel.pivot].matrix[0][3]
-						elif channel.type == 1:
-							key.value = keyframe.co.y - Hierarchy.pivots[channel.pivot].matrix[2][3]
-						elif channel.type == 2:
-							key.value = -(keyframe.co.y - Hierarchy.pivots[channel.pivot].matrix[1][3])
-						
-						elif channel.type == 3:
-							key.value = keyframe.co.y
-						elif channel.type == 4:
-							key.value = -keyframe.co.y
-						elif channel.type == 5:
-							key.value = -keyframe.co.y
-						elif channel.type == 6:
-							key.value = keyframe.co.y
-						else:
-							print("invalid animation channel type")
-						channel.timeCodedKeys.append(key)
-					Animation.channels.append(channel)
+				Animation.channels.extend(CollectAnimationChannels(action, obj.name, Hierarchy, pivotIndices))
 
 	if EXPORT_MODE == 'H':
-		sklFile = open(givenfilepath.replace(fileName, amtName), "wb")
 		Hierarchy.header.name = amtName
-		WriteBF3D(sklFile, amtName)
-		WriteHierarchy(sklFile, Hierarchy) 
-		sklFile.close()
+		files.append((givenfilepath.replace(fileName, amtName), amtName, WriteHierarchy, Hierarchy))
 		
-	if EXPORT_MODE == 'A':
-		aniFile = open(givenfilepath, "wb")
-		WriteBF3D(aniFile, fileName)
-		WriteAnimation(aniFile, Animation)
-		aniFile.close()
\ No newline at end of file
+	if EXPORT_MODE == 'A' and not ALL_ACTIONS:
+		files.append((givenfilepath, fileName, WriteAnimation, Animation))
+
+	return files
\ No newline at end of file
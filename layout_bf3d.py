@@ -0,0 +1,130 @@
+#Mesh layout of the BF3D Format
+#orders the triangles along a morton curve, groups them into clusters and encodes the indices
+#only depends on numpy, so it can be used and tested without blender
+import numpy
+
+#######################################################################################
+# Morton Order
+#######################################################################################
+
+def part1By2(v):
+	#spreads the lower 10 bits of v so there are two zero bits between each of them
+	v = v & 0x3ff
+	v = (v | (v << 16)) & 0x030000ff
+	v = (v | (v << 8)) & 0x0300f00f
+	v = (v | (v << 4)) & 0x030c30c3
+	v = (v | (v << 2)) & 0x09249249
+	return v
+
+def getMortonCodes(points):
+	#30 bit morton codes of the points quantized to 1024 steps in their bounding box
+	low = points.min(axis = 0)
+	extend = points.max(axis = 0) - low
+	extend[extend == 0.0] = 1.0
+	cells = ((points - low) / extend * 1023.0 + 0.5).astype(numpy.int64)
+	return part1By2(cells[:, 0]) | (part1By2(cells[:, 1]) << 1) | (part1By2(cells[:, 2]) << 2)
+
+def sortTriangles(positions, faces):
+	#sorts the faces by the morton code of their centroids and the vertices by their first use
+	#returns the new vertex order (old indices) and the faces with the new indices
+	positions = numpy.asarray(positions, dtype = numpy.float64).reshape(-1, 3)
+	faces = numpy.asarray(faces, dtype = numpy.int64).reshape(-1, 3)
+	vertCount = len(positions)
+	if len(faces) == 0:
+		return numpy.arange(vertCount), faces
+
+	centroids = positions[faces].mean(axis = 1)
+	faces = faces[numpy.argsort(getMortonCodes(centroids), kind = 'mergesort')]
+
+	used, first = numpy.unique(faces.ravel(), return_index = True)
+	unused = numpy.setdiff1d(numpy.arange(vertCount), used)
+	vertexOrder = numpy.concatenate((used[numpy.argsort(first, kind = 'mergesort')], unused))
+	remap = numpy.empty(vertCount, dtype = numpy.int64)
+	remap[vertexOrder] = numpy.arange(vertCount)
+	return vertexOrder, remap[faces]
+
+#######################################################################################
+# Clusters
+#######################################################################################
+
+def getClusterBounds(positions, faces, clusterSize):
+	#returns the first face of every cluster and the (clusterCount, 3) min and max of their boxes
+	positions = numpy.asarray(positions, dtype = numpy.float64).reshape(-1, 3)
+	firsts = numpy.arange(0, len(faces), clusterSize)
+	if len(firsts) == 0:
+		return firsts, numpy.zeros((0, 3)), numpy.zeros((0, 3))
+	corners = positions[faces]
+	boxMin = numpy.minimum.reduceat(corners.min(axis = 1), firsts)
+	boxMax = numpy.maximum.reduceat(corners.max(axis = 1), firsts)
+	return firsts, boxMin, boxMax
+
+#######################################################################################
+# Index Streams
+#######################################################################################
+
+def encodeVarints(values):
+	#little endian base 128 of unsigned 64 bit integers
+	values = numpy.asarray(values, dtype = numpy.uint64)
+	byteCounts = numpy.ones(len(values), dtype = numpy.int64)
+	for k in range(1, 10):
+		byteCounts += values >= numpy.uint64(1 << (7 * k))
+	shifts = numpy.arange(10, dtype = numpy.uint64) * numpy.uint64(7)
+	groups = ((values[:, None] >> shifts[None, :]) & numpy.uint64(0x7f)).astype(numpy.uint8)
+	more = numpy.arange(10)[None, :] < (byteCounts[:, None] - 1)
+	groups[more] |= 0x80
+	return groups[numpy.arange(10)[None, :] < byteCounts[:, None]].tobytes(), byteCounts
+
+def encodeIndices(faces, firsts):
+	#zigzag varints of the differences between successive indices, the difference restarts at 0 in every cluster
+	#returns the stream and the byte offset of every cluster in it
+	indices = numpy.asarray(faces, dtype = numpy.int64).ravel()
+	previous = numpy.concatenate(([0], indices[:-1]))
+	previous[numpy.asarray(firsts, dtype = numpy.int64) * 3] = 0
+	deltas = indices - previous
+	zigzag = ((deltas << 1) ^ (deltas >> 63)).astype(numpy.uint64)
+	stream, byteCounts = encodeVarints(zigzag)
+	offsets = numpy.concatenate(([0], numpy.cumsum(byteCounts)))[numpy.asarray(firsts, dtype = numpy.int64) * 3]
+	return stream, offsets
+
+def decodeIndices(stream, firsts, faceCount):
+	#inverse of encodeIndices, returns the (faceCount, 3) faces
+	data = numpy.frombuffer(stream, dtype = numpy.uint8)
+	if len(data) == 0:
+		return numpy.zeros((faceCount, 3), dtype = numpy.int64)
+	ends = numpy.nonzero((data & 0x80) == 0)[0]
+	starts = numpy.concatenate(([0], ends[:-1] + 1))
+	group = numpy.repeat(numpy.arange(len(starts)), ends - starts + 1)
+	shifts = ((numpy.arange(len(data)) - starts[group]) * 7).astype(numpy.uint64)
+	values = numpy.add.reduceat((data & 0x7f).astype(numpy.uint64) << shifts, starts)
+	deltas = (values >> numpy.uint64(1)).astype(numpy.int64) ^ -(values & numpy.uint64(1)).astype(numpy.int64)
+
+	#prefix sums that restart at every cluster
+	sums = numpy.cumsum(deltas)
+	restart = numpy.asarray(firsts, dtype = numpy.int64) * 3
+	before = numpy.where(restart > 0, sums[restart - 1], 0)
+	cluster = numpy.searchsorted(restart, numpy.arange(len(deltas)), side = 'right') - 1
+	return (sums - before[cluster]).reshape(faceCount, 3)
+
+def createShuffledGrid(size, seed = 0):
+	#a size x size grid in the xy plane with its faces and vertices in random order
+	random = numpy.random.RandomState(seed)
+	x, y = numpy.meshgrid(numpy.arange(size + 1), numpy.arange(size + 1))
+	positions = numpy.stack((x.ravel(), y.ravel(), numpy.zeros(x.size)), axis = 1)
+	quads = (numpy.arange(size)[None, :] + numpy.arange(size)[:, None] * (size + 1)).ravel()
+	faces = numpy.concatenate((
+		numpy.stack((quads, quads + 1, quads + size + 2), axis = 1),
+		numpy.stack((quads, quads + size + 2, quads + size + 1), axis = 1)))
+	shuffle = random.permutation(len(positions))
+	faces = numpy.argsort(shuffle)[faces][random.permutation(len(faces))]
+	return positions[shuffle], faces
+
+if __name__ == "__main__":
+	import time
+	for size in (100, 300, 1000):
+		positions, faces = createShuffledGrid(size)
+		start = time.time()
+		vertexOrder, sorted = sortTriangles(positions, faces)
+		firsts, boxMin, boxMax = getClusterBounds(positions[vertexOrder], sorted, 64)
+		stream, offsets = encodeIndices(sorted, firsts)
+		elapsed = time.time() - start
+		print("%d faces: %d -> %d bytes in %.3f seconds" % (len(faces), len(faces) * 12, len(stream), elapsed))
@@ -0,0 +1,122 @@
+#Live link of the BF3D Format
+#exports the scene again in the background whenever objects or actions change
+import time
+import threading
+import bpy
+from bpy.app.handlers import persistent
+from . import export_bf3d
+
+class LiveLink:
+	def __init__(self, filepath, keywords, compression, debounce):
+		self.filepath = filepath
+		self.keywords = keywords
+		self.compression = compression
+		self.debounce = debounce
+		self.meshCache = export_bf3d.MeshCache()
+		self.imageHashes = {}
+		self.changed = set()
+		self.changedActions = set()
+		self.rigChanged = False
+		self.written = False
+		#the first update writes everything
+		self.firstEdit = time.time()
+		self.lastEdit = self.firstEdit
+		self.thread = None
+		self.latency = None
+
+	def report(self, type, message):
+		print("Live link:", message)
+
+link = None
+
+def startLiveLink(filepath, keywords, compression, debounce):
+	global link
+	link = LiveLink(filepath, keywords, compression, debounce)
+
+def stopLiveLink():
+	global link
+	latency = getLatency()
+	link = None
+	return latency
+
+def getLatency():
+	#seconds from the first edit to the updated files on disk, for the last update
+	if link == None:
+		return None
+	return link.latency
+
+def write(link, files, firstEdit):
+	try:
+		export_bf3d.WriteExportFiles(files, None, link.compression)
+	except Exception as e:
+		print("Live link: export failed:", e)
+		return
+	link.latency = time.time() - firstEdit
+	print("Live link: updated %d files, %.3f seconds after the edit" % (len(files), link.latency))
+
+def update(link):
+	changed = link.changed
+	changedActions = link.changedActions
+	rigChanged = link.rigChanged
+	firstEdit = link.firstEdit
+	link.changed = set()
+	link.changedActions = set()
+	link.rigChanged = False
+	link.firstEdit = None
+
+	allActions = link.keywords.get('EXPORT_MODE') == 'A' and link.keywords.get('ALL_ACTIONS', False)
+	#the action files only depend on the actions and the rest pose of the rig, not on other objects or the current frame
+	#the very first update has no edit behind it and writes everything
+	if allActions and link.written and len(changedActions) == 0 and not rigChanged:
+		return
+
+	files = export_bf3d.CollectExport(link.filepath, bpy.context, link, meshCache = link.meshCache, changed = changed, imageHashes = link.imageHashes, **link.keywords)
+	if allActions and link.written and not rigChanged:
+		#only the files of the edited actions
+		files = [file for file in files if file[3].header.name in changedActions]
+	link.written = True
+	link.thread = threading.Thread(target = write, args = (link, files, firstEdit))
+	link.thread.start()
+
+@persistent
+def onLoadPre(dummy):
+	#the link and its mesh cache belong to the file that is closed now
+	if not link == None:
+		print("Live link: stopped, another file is loaded")
+	stopLiveLink()
+
+@persistent
+def onSceneUpdate(scene):
+	if link == None:
+		return
+	now = time.time()
+	changed = [obj.name for obj in scene.objects if obj.is_updated or obj.is_updated_data]
+	changedActions = []
+	if bpy.data.actions.is_updated:
+		changedActions = [action.name for action in bpy.data.actions if action.is_updated]
+	rigChanged = bpy.data.armatures.is_updated and any(armature.is_updated for armature in bpy.data.armatures)
+	if len(changed) > 0 or len(changedActions) > 0 or rigChanged:
+		link.changed.update(changed)
+		link.changedActions.update(changedActions)
+		link.rigChanged = link.rigChanged or rigChanged
+		if link.firstEdit == None:
+			link.firstEdit = now
+		link.lastEdit = now
+
+	#wait until the edits settle and the last update is on disk
+	if link.firstEdit == None or now - link.lastEdit < link.debounce:
+		return
+	if not link.thread == None and link.thread.is_alive():
+		return
+	update(link)
+
+def register():
+	bpy.app.handlers.load_pre.append(onLoadPre)
+	bpy.app.handlers.scene_update_post.append(onSceneUpdate)
+
+def unregister():
+	stopLiveLink()
+	if onSceneUpdate in bpy.app.handlers.scene_update_post:
+		bpy.app.handlers.scene_update_post.remove(onSceneUpdate)
+	if onLoadPre in bpy.app.handlers.load_pre:
+		bpy.app.handlers.load_pre.remove(onLoadPre)
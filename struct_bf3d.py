@@ -24,6 +24,19 @@ class RGBA(Struct):
 	b = 0
 	a = 0
 	
+#######################################################################################
+# Compression
+#######################################################################################
+
+#chunk 16
+class CompressedChunk(Struct):
+	chunkType = 0 # type of the wrapped chunk
+	uncompressedSize = 0 # size of the wrapped chunk without its head
+	codec = 0
+	# 0 -> zlib
+	# 1 -> lzma
+	payload = b""
+	
 #######################################################################################
 # Model
 #######################################################################################
@@ -34,6 +47,17 @@ class Model(Struct):
 	meshes = []
 	bSphere = None
 	bBox = None
+	bvh = None
+	materials = []
+	
+#######################################################################################
+# Material
+#######################################################################################
+
+#chunk 160 holds all the materials of the model, the index is the materialID
+class Material(Struct):
+	name = ""
+	texture = "" # dds file next to the model
 	
 #######################################################################################
 # Mesh
@@ -62,6 +86,27 @@ class Mesh(Struct):
 	faces = []
 	uvCoords = []
 	vertInfs = []
+	tangents = None # chunk 139, (vertCount, 4) tangent and bitangent sign
+	bonePalette = [] # chunk 137, pivot indices used by skinBones
+	skinBones = None # chunk 138, (vertCount, influences) palette indices
+	skinWeights = None # chunk 138, (vertCount, influences) normalized weights
+	clusters = None # chunk 140, replaces the faces (chunk 133)
+	bBox = None # chunk 192, in the space of the parent pivot
+	bSphere = None # chunk 193, in the space of the parent pivot
+	materialSlot = 0 # material slot of the object the mesh was made of, not written
+	
+#######################################################################################
+# Clusters
+#######################################################################################
+
+#chunk 140
+class MeshClusters(Struct):
+	firstFaces = [] # first face of every cluster
+	faceCounts = []
+	byteOffsets = [] # start of every cluster in the stream
+	boxMin = [] # (clusterCount, 3)
+	boxMax = []
+	stream = b"" # zigzag varint differences of the indices, restarting at 0 in every cluster
 	
 #######################################################################################
 # VertexInfluences
@@ -92,6 +137,21 @@ class Sphere(Struct):
 	center = Vector((0.0, 0.0 ,0.0))
 	radius = 0.0
 	
+#######################################################################################
+# Mesh BVH
+#######################################################################################
+
+class MeshBVHNode(Struct):
+	boxMin = [0.0, 0.0, 0.0] # y up world space
+	boxMax = [0.0, 0.0, 0.0]
+	child = 0 # inner node: index of the right child, leaf: first entry in meshIndices
+	count = 0 # number of meshes in a leaf, 0 for inner nodes
+
+#chunk 194
+class MeshBVH(Struct):
+	nodes = []
+	meshIndices = []
+	
 #######################################################################################
 # Hierarchy
 #######################################################################################
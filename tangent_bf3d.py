@@ -0,0 +1,77 @@
+#Tangent frames of the BF3D Format
+#only depends on numpy, so it can be used and tested without blender
+import numpy
+
+def calcTangents(positions, normals, uvCoords, faces):
+	#per vertex tangents from the triangle uv gradients, orthogonalized against the normals
+	#returns a (vertCount, 4) float32 array: the tangent and the sign of the bitangent (w)
+	positions = numpy.asarray(positions, dtype = numpy.float64).reshape(-1, 3)
+	normals = numpy.asarray(normals, dtype = numpy.float64).reshape(-1, 3)
+	uvCoords = numpy.asarray(uvCoords, dtype = numpy.float64).reshape(-1, 2)
+	faces = numpy.asarray(faces, dtype = numpy.int64).reshape(-1, 3)
+	vertCount = len(positions)
+
+	p0, p1, p2 = positions[faces[:, 0]], positions[faces[:, 1]], positions[faces[:, 2]]
+	t0, t1, t2 = uvCoords[faces[:, 0]], uvCoords[faces[:, 1]], uvCoords[faces[:, 2]]
+	e1 = p1 - p0
+	e2 = p2 - p0
+	d1 = t1 - t0
+	d2 = t2 - t0
+
+	#faces without uv area do not contribute
+	det = d1[:, 0] * d2[:, 1] - d2[:, 0] * d1[:, 1]
+	valid = numpy.abs(det) > 1e-12
+	r = numpy.where(valid, 1.0 / numpy.where(valid, det, 1.0), 0.0)[:, None]
+	sdir = (e1 * d2[:, 1:2] - e2 * d1[:, 1:2]) * r
+	tdir = (e2 * d1[:, 0:1] - e1 * d2[:, 0:1]) * r
+
+	#bincount sums in a fixed order, so the result is deterministic
+	corners = faces.ravel()
+	tan = numpy.empty((vertCount, 3))
+	bitan = numpy.empty((vertCount, 3))
+	for axis in range(3):
+		tan[:, axis] = numpy.bincount(corners, numpy.repeat(sdir[:, axis], 3), minlength = vertCount)
+		bitan[:, axis] = numpy.bincount(corners, numpy.repeat(tdir[:, axis], 3), minlength = vertCount)
+
+	#gram schmidt
+	tan -= normals * (normals * tan).sum(axis = 1)[:, None]
+	length = numpy.sqrt((tan ** 2).sum(axis = 1))
+
+	#vertices without a usable tangent get any vector perpendicular to the normal
+	degenerate = length < 1e-12
+	if degenerate.any():
+		n = normals[degenerate]
+		helper = numpy.where(numpy.abs(n[:, 0:1]) < 0.9, [[1.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+		fallback = numpy.cross(n, helper)
+		tan[degenerate] = fallback
+		length[degenerate] = numpy.sqrt((fallback ** 2).sum(axis = 1))
+	tan /= numpy.where(length > 0.0, length, 1.0)[:, None]
+
+	tangents = numpy.empty((vertCount, 4), dtype = numpy.float32)
+	tangents[:, 0:3] = tan
+	tangents[:, 3] = numpy.where((numpy.cross(normals, tan) * bitan).sum(axis = 1) < 0.0, -1.0, 1.0)
+	return tangents
+
+#######################################################################################
+# Benchmark
+#######################################################################################
+
+def createGrid(size):
+	#a size x size grid in the xy plane with uvs matching the positions
+	x, y = numpy.meshgrid(numpy.arange(size + 1, dtype = numpy.float64), numpy.arange(size + 1, dtype = numpy.float64))
+	positions = numpy.stack((x.ravel(), y.ravel(), numpy.zeros(x.size)), axis = 1)
+	normals = numpy.tile([0.0, 0.0, 1.0], (len(positions), 1))
+	uvCoords = positions[:, 0:2] / size
+	quads = (numpy.arange(size)[None, :] + numpy.arange(size)[:, None] * (size + 1)).ravel()
+	faces = numpy.concatenate((
+		numpy.stack((quads, quads + 1, quads + size + 2), axis = 1),
+		numpy.stack((quads, quads + size + 2, quads + size + 1), axis = 1)))
+	return positions, normals, uvCoords, faces
+
+if __name__ == "__main__":
+	import time
+	for size in (100, 300, 1000):
+		positions, normals, uvCoords, faces = createGrid(size)
+		start = time.time()
+		tangents = calcTangents(positions, normals, uvCoords, faces)
+		print("%d verts, %d faces: %.3f seconds" % (len(positions), len(faces), time.time() - start))
@@ -0,0 +1,93 @@
+#Tests of the mesh layout and the index streams, they only need numpy
+import os
+import sys
+import unittest
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import layout_bf3d
+
+def roundTrip(faces, clusterSize):
+	firsts = numpy.arange(0, len(faces), clusterSize)
+	stream, offsets = layout_bf3d.encodeIndices(faces, firsts)
+	return layout_bf3d.decodeIndices(stream, firsts, len(faces)), stream, offsets
+
+class SortTrianglesTest(unittest.TestCase):
+	def test_same_faces(self):
+		positions, faces = layout_bf3d.createShuffledGrid(10)
+		vertexOrder, sortedFaces = layout_bf3d.sortTriangles(positions, faces)
+		self.assertEqual(sorted(vertexOrder.tolist()), list(range(len(positions))))
+		#mapped back to the old vertices, the same faces with the same winding
+		self.assertEqual(sorted(map(tuple, vertexOrder[sortedFaces].tolist())), sorted(map(tuple, faces.tolist())))
+
+	def test_first_use_order(self):
+		positions, faces = layout_bf3d.createShuffledGrid(10)
+		vertexOrder, sortedFaces = layout_bf3d.sortTriangles(positions, faces)
+		indices = sortedFaces.ravel()
+		firstUse = numpy.unique(indices, return_index = True)[1]
+		self.assertTrue((numpy.diff(firstUse) > 0).all())
+
+	def test_unused_vertices(self):
+		positions, faces = layout_bf3d.createShuffledGrid(4)
+		vertexOrder, sortedFaces = layout_bf3d.sortTriangles(positions, faces[:5])
+		self.assertEqual(sorted(vertexOrder.tolist()), list(range(len(positions))))
+		self.assertEqual(sorted(map(tuple, vertexOrder[sortedFaces].tolist())), sorted(map(tuple, faces[:5].tolist())))
+
+	def test_empty(self):
+		positions, faces = layout_bf3d.createShuffledGrid(2)
+		vertexOrder, sortedFaces = layout_bf3d.sortTriangles(positions, [])
+		self.assertEqual(vertexOrder.tolist(), list(range(len(positions))))
+		self.assertEqual(sortedFaces.shape, (0, 3))
+
+class IndexStreamTest(unittest.TestCase):
+	def test_round_trip(self):
+		positions, faces = layout_bf3d.createShuffledGrid(30)
+		vertexOrder, sortedFaces = layout_bf3d.sortTriangles(positions, faces)
+		#1800 faces, most of the sizes do not divide the face count
+		for clusterSize in (1, 7, 64, 100, 1799, 1800, 5000):
+			decoded, stream, offsets = roundTrip(sortedFaces, clusterSize)
+			numpy.testing.assert_array_equal(decoded, sortedFaces)
+			self.assertEqual(len(offsets), -(-len(faces) // clusterSize))
+
+	def test_unsorted_round_trip(self):
+		#large jumps between the indices need several bytes per varint
+		positions, faces = layout_bf3d.createShuffledGrid(30)
+		decoded, stream, offsets = roundTrip(faces, 64)
+		numpy.testing.assert_array_equal(decoded, faces)
+
+	def test_cluster_offsets(self):
+		#every cluster decodes on its own from its byte offset
+		positions, faces = layout_bf3d.createShuffledGrid(10)
+		firsts = numpy.arange(0, len(faces), 64)
+		stream, offsets = layout_bf3d.encodeIndices(faces, firsts)
+		ends = numpy.append(offsets[1:], len(stream))
+		for first, start, end in zip(firsts, offsets, ends):
+			count = min(64, len(faces) - first)
+			decoded = layout_bf3d.decodeIndices(stream[start:end], [0], count)
+			numpy.testing.assert_array_equal(decoded, faces[first:first + count])
+
+	def test_empty(self):
+		faces = numpy.zeros((0, 3), dtype = numpy.int64)
+		decoded, stream, offsets = roundTrip(faces, 64)
+		self.assertEqual(stream, b"")
+		self.assertEqual(len(offsets), 0)
+		self.assertEqual(decoded.shape, (0, 3))
+
+class ClusterBoundsTest(unittest.TestCase):
+	def test_bounds(self):
+		positions, faces = layout_bf3d.createShuffledGrid(10)
+		firsts, boxMin, boxMax = layout_bf3d.getClusterBounds(positions, faces, 7)
+		self.assertEqual(len(firsts), -(-len(faces) // 7))
+		for index, first in enumerate(firsts):
+			corners = positions[faces[first:first + 7]].reshape(-1, 3)
+			numpy.testing.assert_array_equal(boxMin[index], corners.min(axis = 0))
+			numpy.testing.assert_array_equal(boxMax[index], corners.max(axis = 0))
+
+	def test_empty(self):
+		positions, faces = layout_bf3d.createShuffledGrid(2)
+		firsts, boxMin, boxMax = layout_bf3d.getClusterBounds(positions, faces[:0], 64)
+		self.assertEqual(len(firsts), 0)
+		self.assertEqual(boxMin.shape, (0, 3))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,51 @@
+#Tests of the tangent generator, they only need numpy
+import os
+import sys
+import unittest
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tangent_bf3d
+
+class CalcTangentsTest(unittest.TestCase):
+	def test_grid(self):
+		positions, normals, uvCoords, faces = tangent_bf3d.createGrid(4)
+		tangents = tangent_bf3d.calcTangents(positions, normals, uvCoords, faces)
+		self.assertEqual(tangents.shape, (len(positions), 4))
+		self.assertEqual(tangents.dtype, numpy.float32)
+		numpy.testing.assert_allclose(tangents[:, 0:3], numpy.tile([1.0, 0.0, 0.0], (len(positions), 1)), atol = 1e-6)
+		numpy.testing.assert_array_equal(tangents[:, 3], 1.0)
+
+	def test_flipped_v(self):
+		positions, normals, uvCoords, faces = tangent_bf3d.createGrid(4)
+		uvCoords = uvCoords.copy()
+		uvCoords[:, 1] = 1.0 - uvCoords[:, 1]
+		tangents = tangent_bf3d.calcTangents(positions, normals, uvCoords, faces)
+		numpy.testing.assert_allclose(tangents[:, 0:3], numpy.tile([1.0, 0.0, 0.0], (len(positions), 1)), atol = 1e-6)
+		numpy.testing.assert_array_equal(tangents[:, 3], -1.0)
+
+	def test_degenerate_uvs(self):
+		#all uvs in one point, the tangents fall back to any vector perpendicular to the normal
+		positions, normals, uvCoords, faces = tangent_bf3d.createGrid(2)
+		tangents = tangent_bf3d.calcTangents(positions, normals, numpy.zeros_like(uvCoords), faces)
+		self.assertTrue(numpy.isfinite(tangents).all())
+		numpy.testing.assert_allclose(numpy.linalg.norm(tangents[:, 0:3], axis = 1), 1.0, atol = 1e-6)
+		numpy.testing.assert_allclose((tangents[:, 0:3] * normals).sum(axis = 1), 0.0, atol = 1e-6)
+		numpy.testing.assert_array_equal(numpy.abs(tangents[:, 3]), 1.0)
+
+	def test_empty(self):
+		tangents = tangent_bf3d.calcTangents([], [], [], [])
+		self.assertEqual(tangents.shape, (0, 4))
+
+	def test_deterministic(self):
+		positions, normals, uvCoords, faces = tangent_bf3d.createGrid(8)
+		#a bumpy surface with irregular uvs, so the sums are not trivially exact
+		random = numpy.random.RandomState(0)
+		positions = positions + random.uniform(-0.3, 0.3, positions.shape)
+		uvCoords = uvCoords + random.uniform(-0.01, 0.01, uvCoords.shape)
+		first = tangent_bf3d.calcTangents(positions, normals, uvCoords, faces)
+		for run in range(3):
+			self.assertEqual(tangent_bf3d.calcTangents(positions, normals, uvCoords, faces).tobytes(), first.tobytes())
+
+if __name__ == "__main__":
+	unittest.main()